@@ -24,11 +24,13 @@ exec(open('patch_torchaudio.py').read())
 
 from speechbrain.pretrained import SpeakerRecognition
 from sklearn.cluster import SpectralClustering
-from scipy.spatial.distance import pdist, squareform
+from scipy.spatial.distance import squareform
 import whisper
 import warnings
 from pathlib import Path
 import requests
+from embedding_cache import cache_embeddings, file_digest
+from embedding_distances import pairwise_cosine, pairwise_cosine_int8, quantize_embeddings_int8
 
 warnings.filterwarnings("ignore")
 
@@ -65,6 +67,15 @@ app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100 MB max file size
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100 MB
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'm4a', 'flac', 'ogg', 'aac'}
 PROCESSING_TIMEOUT = 300  # 5 хвилин
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', '64'))  # вікон на один виклик encode_batch
+# Autocast для ECAPA: за замовчуванням fp16 на CUDA; EMBEDDING_AUTOCAST=1 вмикає bf16 і на CPU, 0 - вимикає
+EMBEDDING_AUTOCAST = os.environ.get('EMBEDDING_AUTOCAST')
+# Вікна з RMS нижче порогу вважаються тишею і не кодуються (0 - вимкнути)
+EMBEDDING_SILENCE_RMS = float(os.environ.get('EMBEDDING_SILENCE_RMS', '1e-3'))
+# Локальна папка моделі SpeechBrain (звідси або з HuggingFace в неї ж)
+SPEAKER_MODEL_DIR = "pretrained_models/spkrec-ecapa-voxceleb"
+# EMBEDDING_INT8=1 - матриця відстаней для кластеризації рахується по int8-квантованих ембедингах
+EMBEDDING_INT8 = os.environ.get('EMBEDDING_INT8') == '1'
 
 # Дозволи для завантажень
 UPLOAD_FOLDER = 'temp_uploads'
@@ -103,7 +114,7 @@ def load_models():
         print("🔄 Loading SpeechBrain speaker recognition model...")
         try:
             # Спробуємо завантажити з локальної папки
-            model_path = "pretrained_models/spkrec-ecapa-voxceleb"
+            model_path = SPEAKER_MODEL_DIR
             if os.path.exists(model_path) and os.path.exists(os.path.join(model_path, "hyperparams.yaml")):
                 print(f"📂 Loading from local directory: {model_path}")
                 speaker_model = SpeakerRecognition.from_hparams(
@@ -115,7 +126,7 @@ def load_models():
                 print("🌐 Loading from HuggingFace...")
                 speaker_model = SpeakerRecognition.from_hparams(
                     source="speechbrain/spkrec-ecapa-voxceleb",
-                    savedir="pretrained_models/spkrec-ecapa-voxceleb"
+                    savedir=SPEAKER_MODEL_DIR
                 )
             print("✅ SpeechBrain model loaded successfully!")
         except Exception as e:
@@ -175,7 +186,103 @@ model_loading_thread = threading.Thread(target=load_models_background, daemon=Tr
 model_loading_thread.start()
 
 
-def extract_speaker_embeddings(audio_path, segment_duration=1.5, overlap=0.5):
+def embedding_autocast(device_type):
+    """Повертає (use_autocast, dtype) для ECAPA на пристрої device_type з урахуванням EMBEDDING_AUTOCAST"""
+    if EMBEDDING_AUTOCAST is None:
+        use_autocast = device_type == 'cuda'
+    else:
+        use_autocast = EMBEDDING_AUTOCAST == '1'
+    return use_autocast, torch.float16 if device_type == 'cuda' else torch.bfloat16
+
+
+_speaker_model_digest = None
+
+
+def embedding_cache_settings():
+    """
+    Налаштування, від яких залежать ембеддинги, але яких немає серед аргументів
+    extract_speaker_embeddings: файли моделі, пристрій і точність autocast.
+    Входять у ключ дискового кешу ембеддингів.
+    """
+    global _speaker_model_digest
+    if speaker_model is None:
+        load_models()
+    if _speaker_model_digest is None:
+        model_files = sorted(
+            os.path.join(SPEAKER_MODEL_DIR, name) for name in os.listdir(SPEAKER_MODEL_DIR)
+            if name.endswith(('.ckpt', '.yaml'))
+        )
+        _speaker_model_digest = file_digest(*model_files)
+    device_type = torch.device(getattr(speaker_model, 'device', 'cpu')).type
+    use_autocast, autocast_dtype = embedding_autocast(device_type)
+    return {
+        'model': _speaker_model_digest,
+        'device': device_type,
+        'autocast': str(autocast_dtype) if use_autocast else None,
+    }
+
+
+def encode_segments_batched(audio, segment_samples, stride_samples, silence_rms=EMBEDDING_SILENCE_RMS):
+    """
+    Витягує ембеддинги для всіх вікон однакової довжини батчами.
+    
+    Args:
+        audio: моно аудіо (float32, 16 кГц)
+        segment_samples: довжина вікна в семплах
+        stride_samples: крок між вікнами в семплах
+        silence_rms: поріг RMS, нижче якого вікно вважається тишею і не кодується (0 - кодувати всі вікна)
+    
+    Returns:
+        embeddings: матриця ембедингів (M, 192) лише для не тихих вікон
+        kept: індекси цих вікон (вікно i починається з i * stride_samples)
+    """
+    device = torch.device(getattr(speaker_model, 'device', 'cpu'))
+    device_type = device.type
+    use_autocast, autocast_dtype = embedding_autocast(device_type)
+    
+    # Аудіо завантажується на пристрій один раз; вікна - це view через unfold без копіювання,
+    # копіюється лише поточний батч
+    host_waveform = torch.from_numpy(np.ascontiguousarray(audio, dtype=np.float32))
+    if device_type == 'cuda':
+        # З pinned буфера копіювання асинхронне; encode_batch на тому ж потоці дочекається його сам
+        host_waveform = host_waveform.pin_memory()
+    waveform = host_waveform.to(device, non_blocking=True)
+    windows = waveform.unfold(0, segment_samples, stride_samples)  # [N, segment_samples]
+    
+    batches = []
+    kept = []
+    with torch.no_grad(), torch.autocast(device_type=device_type, dtype=autocast_dtype, enabled=use_autocast):
+        for batch_start in range(0, windows.shape[0], EMBEDDING_BATCH_SIZE):
+            batch = windows[batch_start:batch_start + EMBEDDING_BATCH_SIZE].contiguous()
+            batch_indices = torch.arange(batch_start, batch_start + batch.shape[0])
+            
+            # Енергетичний гейт: тихі вікна не йдуть в енкодер і не потрапляють у кластеризацію
+            if silence_rms > 0:
+                active = batch.float().square().mean(dim=1) > silence_rms ** 2
+                active_host = active.cpu()
+                if not active_host.any():
+                    continue
+                if not active_host.all():
+                    batch = batch[active]
+                    batch_indices = batch_indices[active_host]
+            
+            wav_lens = torch.ones(batch.shape[0], device=device)
+            # [batch, samples] -> [batch, 1, 192]; ембеддинги повертаються у float32 для кластеризації
+            embedding_tensor = speaker_model.encode_batch(batch, wav_lens=wav_lens)
+            batches.append(embedding_tensor.squeeze(1).float())
+            kept.append(batch_indices)
+    
+    silent_count = windows.shape[0] - sum(len(indices) for indices in kept)
+    if silent_count:
+        print(f"🔇 Skipped {silent_count}/{windows.shape[0]} silent windows (RMS <= {silence_rms:g})")
+    if not batches:
+        return np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64)
+    # Один перенос на CPU для всіх батчів
+    return torch.cat(batches).cpu().numpy(), torch.cat(kept).numpy()
+
+
+@cache_embeddings(settings=embedding_cache_settings)
+def extract_speaker_embeddings(audio_path, segment_duration=1.5, overlap=0.5, audio=None, silence_rms=EMBEDDING_SILENCE_RMS):
     """
     Витягує ембеддинги спікера для сегментів аудіо.
     
@@ -183,6 +290,8 @@ def extract_speaker_embeddings(audio_path, segment_duration=1.5, overlap=0.5):
         audio_path: шлях до аудіофайлу
         segment_duration: довжина сегмента в секундах
         overlap: перекриття між сегментами (0-1)
+        audio: вже завантажене моно аудіо 16 кГц (float32); якщо передано, файл не читається повторно
+        silence_rms: поріг RMS; тихіші вікна пропускаються разом зі своїми мітками часу (0 - вимкнути)
     
     Returns:
         embeddings: матриця ембедингів (N, 192)
@@ -195,11 +304,14 @@ def extract_speaker_embeddings(audio_path, segment_duration=1.5, overlap=0.5):
     
     try:
         # Завантажуємо аудіо
-        print(f"📂 Loading audio from: {audio_path}")
         import sys
-        sys.stdout.flush()
-        
-        audio, sr = librosa.load(audio_path, sr=16000, mono=True)
+        if audio is None:
+            print(f"📂 Loading audio from: {audio_path}")
+            sys.stdout.flush()
+            audio, sr = librosa.load(audio_path, sr=16000, mono=True)
+        else:
+            print(f"📂 Using preloaded audio for: {audio_path}")
+            sr = 16000
         duration = librosa.get_duration(y=audio, sr=sr)
         print(f"⏱️  Audio duration: {duration:.2f} seconds, sample rate: {sr} Hz, samples: {len(audio)}")
         sys.stdout.flush()
@@ -283,7 +395,26 @@ def extract_speaker_embeddings(audio_path, segment_duration=1.5, overlap=0.5):
             max_start = 0
         
         segments_processed = 0
-        for start_sample in range(0, max_start + 1, stride_samples):
+        segment_starts = range(0, max_start + 1, stride_samples)
+        fallback_starts = []
+        
+        # Всі вікна мають однакову довжину, тому кодуються батчами по EMBEDDING_BATCH_SIZE
+        # за один виклик encode_batch замість виклику на кожен сегмент
+        try:
+            embeddings, kept = encode_segments_batched(audio, segment_samples, stride_samples, silence_rms)
+            timestamps = [
+                (start_sample / sr, min((start_sample + segment_samples) / sr, duration))
+                for start_sample in (segment_starts[index] for index in kept)
+            ]
+            segments_processed = len(embeddings)
+            print(f"✅ Extracted {segments_processed} embeddings in batches of {EMBEDDING_BATCH_SIZE}, shape: {embeddings.shape}")
+        except Exception as e:
+            print(f"⚠️  Batched embedding extraction failed ({e}), falling back to per-segment extraction")
+            embeddings = []
+            timestamps = []
+            fallback_starts = segment_starts
+        
+        for start_sample in fallback_starts:
             end_sample = min(start_sample + segment_samples, len(audio))
             segment = audio[start_sample:end_sample]
             
@@ -411,8 +542,12 @@ def diarize_audio(embeddings, timestamps, num_speakers=None):
         embeddings_normalized = normalize(embeddings, norm='l2')
         
         # Обчислюємо косинусну відстань між ембедингами
-        distances = pdist(embeddings_normalized, metric='cosine')
-        distance_matrix = squareform(distances)
+        if EMBEDDING_INT8:
+            embeddings_q, _ = quantize_embeddings_int8(embeddings_normalized)
+            distance_matrix = pairwise_cosine_int8(embeddings_q)
+        else:
+            distance_matrix = pairwise_cosine(embeddings_normalized)
+        distances = squareform(distance_matrix, checks=False)
         
         # Діагностика: перевіряємо розподіл відстаней
         mean_dist = np.mean(distances)
@@ -19,8 +19,25 @@ except ImportError:  # pragma: no cover - optional dependency until Azure is ena
     BlobServiceClient = None
     generate_blob_sas = None
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+ISO_DURATION_PATTERN = re.compile(r"PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?")
+
+
+def dumps_pretty(obj: Any) -> str:
+    """
+    Indented JSON for logs and diagnostic dumps; orjson when it is installed (much
+    faster on large payloads). Non-ASCII text is kept as UTF-8 either way.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
 
 class AzureSpeechClient:
     """Azure Speech-to-Text batch transcription client with diarization support."""
@@ -266,8 +283,14 @@ class AzureSpeechClient:
 
     @staticmethod
     def _parse_iso_duration(duration_str: str) -> float:
-        pattern = r"PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?"
-        match = re.match(pattern, duration_str or "")
+        # Fast path: Azure emits offsets and durations as plain "PT<seconds>S"
+        if duration_str and duration_str.startswith("PT") and duration_str.endswith("S"):
+            # Same shape as the pattern's seconds group (\d+(?:\.\d+)?); anything else
+            # float() would accept ("inf", "nan", "-1", "1e3") goes through the regex
+            whole, dot, frac = duration_str[2:-1].partition(".")
+            if whole.isascii() and whole.isdigit() and (not dot or (frac.isascii() and frac.isdigit())):
+                return float(duration_str[2:-1])
+        match = ISO_DURATION_PATTERN.match(duration_str or "")
         if not match:
             return 0.0
         hours, minutes, seconds = match.groups(default="0")
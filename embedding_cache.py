@@ -0,0 +1,125 @@
+"""
+On-disk memoisation of speaker embeddings keyed by audio content.
+
+Enabled with EMBEDDING_CACHE=1. Entries are stored as plain .npy files under
+EMBEDDING_CACHE_DIR (default ~/.diarization_cache). Settings that change the
+output but are not call arguments (model files, autocast, ...) are supplied by
+the caller through cache_embeddings(settings=...) and hashed into the key.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+CACHE_ENABLED = os.environ.get('EMBEDDING_CACHE') == '1'
+CACHE_DIR = Path(os.environ.get('EMBEDDING_CACHE_DIR', '~/.diarization_cache')).expanduser()
+READ_BLOCK_BYTES = 1 << 20
+
+
+def _update_from_file(digest, path):
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK_BYTES), b''):
+            digest.update(block)
+
+
+def file_digest(*paths):
+    """Hex digest of the contents of the given files, read in blocks."""
+    digest = hashlib.blake2b(digest_size=20)
+    for path in paths:
+        _update_from_file(digest, path)
+    return digest.hexdigest()
+
+
+def cache_key(audio_path, audio=None, **params):
+    """
+    Hex digest of the audio content plus the extraction parameters.
+
+    Preloaded samples are hashed directly; otherwise the file is hashed in
+    blocks so large recordings are never read into memory at once.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    if audio is not None:
+        digest.update(np.ascontiguousarray(audio, dtype=np.float32).data)
+    else:
+        _update_from_file(digest, audio_path)
+    if orjson is not None:
+        digest.update(orjson.dumps(params, option=orjson.OPT_SORT_KEYS))
+    else:
+        digest.update(json.dumps(params, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _save_atomic(path, array):
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array, allow_pickle=False)
+    os.replace(tmp_path, path)
+
+
+def cache_embeddings(settings=None):
+    """
+    Decorator for an ``extract_speaker_embeddings(audio_path, ..., audio=None)``-style
+    function so (embeddings, timestamps) are loaded from disk when the same
+    audio was already processed with the same parameters.
+
+    settings, if given, is called on every cached call and must return a
+    JSON-serialisable dict of everything else the result depends on (model
+    identity, precision, ...); it is part of the key.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not CACHE_ENABLED:
+                return func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            audio_path = params.pop('audio_path')
+            audio = params.pop('audio', None)
+            try:
+                if settings is not None:
+                    params['_settings'] = settings()
+                key = cache_key(audio_path, audio, **params)
+            except (OSError, TypeError, ValueError) as e:
+                print(f"⚠️  Embedding cache disabled for this call: {e}")
+                return func(*args, **kwargs)
+
+            embeddings_path = CACHE_DIR / f'{key}.npy'
+            timestamps_path = CACHE_DIR / f'{key}.timestamps.npy'
+            if embeddings_path.exists() and timestamps_path.exists():
+                try:
+                    # Copy-on-write memmap: no read up front, callers may still modify the array
+                    embeddings = np.load(embeddings_path, mmap_mode='c', allow_pickle=False)
+                    timestamps = [tuple(row) for row in np.load(timestamps_path, allow_pickle=False).tolist()]
+                    print(f"💾 Loaded {len(timestamps)} cached embeddings for: {audio_path}")
+                    return embeddings, timestamps
+                except (OSError, ValueError) as e:
+                    print(f"⚠️  Ignoring unreadable embedding cache entry {key}: {e}")
+
+            embeddings, timestamps = func(*args, **kwargs)
+            if embeddings is not None and len(timestamps) > 0:
+                try:
+                    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                    _save_atomic(embeddings_path, np.asarray(embeddings, dtype=np.float32))
+                    _save_atomic(timestamps_path, np.asarray(timestamps, dtype=np.float64))
+                except OSError as e:
+                    print(f"⚠️  Failed to write embedding cache entry {key}: {e}")
+            return embeddings, timestamps
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,79 @@
+"""
+Pairwise cosine distances between speaker embeddings for clustering.
+
+Kept free of the Flask app and model imports so diagnostic scripts can use
+the exact functions diarize_audio runs. numba is optional: without it the
+distances come from scipy pdist.
+"""
+
+import numpy as np
+from scipy.spatial.distance import pdist, squareform
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+if numba is not None:
+    # Без явної сигнатури njit компілює ядро ліниво - при першому виклику, а не при імпорті
+    @numba.njit(parallel=True, cache=True)
+    def _pairwise_cosine_kernel(emb):
+        """Повна матриця косинусних відстаней у float64, як pdist; рядки рахуються паралельно через prange"""
+        n, dim = emb.shape
+        norms = np.sqrt((emb * emb).sum(axis=1))
+        result = np.zeros((n, n), dtype=np.float64)
+        for i in numba.prange(n):
+            for j in range(i + 1, n):
+                dot = 0.0
+                for k in range(dim):
+                    dot += emb[i, k] * emb[j, k]
+                denom = norms[i] * norms[j]
+                dist = 1.0 - dot / denom if denom > 0 else 1.0
+                # pdist(metric='cosine') обрізає відстань до [0, 2]
+                dist = min(max(dist, 0.0), 2.0)
+                result[i, j] = dist
+                result[j, i] = dist
+        return result
+else:
+    _pairwise_cosine_kernel = None
+
+
+def pairwise_cosine(emb):
+    """
+    Матриця косинусних відстаней N×N між ембедингами (float64).
+    З numba - JIT-ядро, без неї - scipy pdist + squareform.
+    """
+    if _pairwise_cosine_kernel is not None:
+        return _pairwise_cosine_kernel(np.ascontiguousarray(emb, dtype=np.float64))
+    return squareform(pdist(emb, metric='cosine'))
+
+
+def quantize_embeddings_int8(embeddings):
+    """
+    Симетрична int8 квантизація ембедингів з масштабом на рядок (max-abs).
+    
+    Returns:
+        q: матриця int8 (N, D)
+        scale: масштаби float32 (N, 1); embeddings ≈ q * scale
+    """
+    scale = np.abs(embeddings).max(axis=1, keepdims=True).astype(np.float32) / 127.0
+    scale[scale == 0] = 1.0  # захист від ділення на нуль для нульових рядків
+    q = np.round(embeddings / scale).astype(np.int8)
+    return q, scale
+
+
+def pairwise_cosine_int8(q):
+    """
+    Матриця косинусних відстаней по int8 ембедингах. Масштаб рядка скорочується в косинусі,
+    тому scale не потрібен. Скалярні добутки рахуються через float32 BLAS і є точними:
+    |q_i · q_j| <= D * 127 * 127 < 2**24 для D <= 1040.
+    """
+    q_float = q.astype(np.float32)
+    gram = q_float @ q_float.T
+    norms = np.sqrt(np.diag(gram))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance_matrix = 1.0 - gram / np.outer(norms, norms)
+    distance_matrix = np.nan_to_num(distance_matrix, nan=1.0)
+    np.fill_diagonal(distance_matrix, 0.0)
+    return np.clip(distance_matrix, 0.0, 2.0).astype(np.float64)
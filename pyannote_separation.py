@@ -16,21 +16,171 @@ from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
 
-# Import patch BEFORE pyannote to fix torchaudio compatibility
-import pyannote_patch  # noqa: F401
-
 try:
-    import torch
-    import torchaudio
-    from pyannote.audio import Pipeline
-    import scipy.io.wavfile
-    import numpy as np
-except ImportError as e:
-    print(json.dumps({
-        "success": False,
-        "error": f"Missing required package: {e.name}. Please install: pip install pyannote.audio torch torchaudio scipy"
-    }), file=sys.stderr)
-    sys.exit(1)
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def import_heavy_modules():
+    """
+    Imports torch, torchaudio, pyannote.audio, scipy and numpy into module globals.
+    Deferred until a job actually runs so --help and argument/file errors stay fast.
+
+    Returns:
+        None on success, or an error result dict for the caller to emit
+        (so a missing package does not kill a --server worker)
+    """
+    global torch, torchaudio, Pipeline, scipy, np, julius
+    # julius is bound last, only once every required import has succeeded
+    if "julius" in globals():
+        return None
+    try:
+        # Import patch BEFORE pyannote to fix torchaudio compatibility
+        import pyannote_patch  # noqa: F401
+        import torch
+        import torchaudio
+        from pyannote.audio import Pipeline
+        import scipy.io.wavfile
+        import numpy as np
+    except ImportError as e:
+        return {
+            "success": False,
+            "error": f"Missing required package: {e.name}. Please install: pip install pyannote.audio torch torchaudio scipy"
+        }
+    try:
+        # Optional: single-conv1d sinc resampler, several times faster than torchaudio's
+        import julius
+    except ImportError:
+        julius = None
+    return None
+
+
+def emit_result(result):
+    """Writes result to stdout as one JSON line, via orjson when it is installed."""
+    if orjson is not None:
+        sys.stdout.buffer.write(orjson.dumps(result) + b"\n")
+    else:
+        sys.stdout.write(json.dumps(result) + "\n")
+    sys.stdout.flush()
+
+
+# Pipelines loaded in this process, keyed by device (reused in --server mode)
+_PIPELINE_CACHE = {}
+
+# Resamplers to 16 kHz built in this process, keyed by (source sample rate, device)
+_RESAMPLER_CACHE = {}
+
+
+def directory_size(path):
+    """
+    Returns the total size in bytes of all files under path.
+    Uses os.scandir so each entry is stat'ed once from the DirEntry cache.
+    """
+    total_size = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        total_size += directory_size(entry.path)
+                    else:
+                        total_size += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return total_size
+
+
+def load_pipeline(hf_token, device):
+    """
+    Load the pyannote separation pipeline onto device.
+    
+    Returns:
+        (pipeline, None) on success or (None, error_result) on failure
+    """
+    # Check cache before loading
+    cache_dir = os.path.expanduser("~/.cache/huggingface/hub")
+    model_cache_path = os.path.join(cache_dir, "models--pyannote--speech-separation-ami-1.0")
+    
+    was_cached = os.path.exists(model_cache_path)
+    if was_cached:
+        print("✅ Model found in cache, loading from cache...", file=sys.stderr)
+        sys.stderr.flush()
+    else:
+        print("📥 Model not in cache, will download from Hugging Face...", file=sys.stderr)
+        print("⏳ This may take 5-10 minutes on first run (depending on internet speed)...", file=sys.stderr)
+        sys.stderr.flush()
+    
+    # Heartbeat for long operations
+    loading_complete = threading.Event()
+    heartbeat_count = [0]
+    
+    def heartbeat():
+        """Print heartbeat messages while model is loading"""
+        while not loading_complete.wait(30):  # Every 30 seconds
+            heartbeat_count[0] += 1
+            msg = f"⏳ [Progress {heartbeat_count[0] * 30}s] Still downloading/loading model...\n"
+            sys.stderr.write(msg)
+            sys.stderr.flush()
+    
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+    
+    # Load pipeline
+    print("🔄 Starting model loading process...", file=sys.stderr)
+    sys.stderr.flush()
+    
+    try:
+        print("📦 Calling Pipeline.from_pretrained()...", file=sys.stderr)
+        sys.stderr.flush()
+        
+        pipeline = Pipeline.from_pretrained(
+            "pyannote/speech-separation-ami-1.0",
+            use_auth_token=hf_token
+        )
+        
+        loading_complete.set()  # Stop heartbeat
+        
+        # Check if model was downloaded and show cache size
+        if not was_cached and os.path.exists(model_cache_path):
+            size_mb = directory_size(model_cache_path) / (1024 * 1024)
+            print(f"✅ Model successfully downloaded and cached! ({size_mb:.1f} MB)", file=sys.stderr)
+            sys.stderr.flush()
+        
+        if pipeline is None:
+            return None, {
+                "success": False,
+                "error": "Failed to load pipeline. The model might be gated. Please:\n1. Visit https://hf.co/pyannote/speech-separation-ami-1.0 to accept the user conditions\n2. Make sure your HUGGINGFACE_TOKEN is valid and has access to this model"
+            }
+        
+        print("🔄 Moving pipeline to device...", file=sys.stderr)
+        sys.stderr.flush()
+        pipeline.to(device)
+        print("✅ Model loaded successfully and ready to use!", file=sys.stderr)
+        sys.stderr.flush()
+        
+    except Exception as e:
+        loading_complete.set()  # Stop heartbeat on error
+        error_msg = str(e)
+        if "gated" in error_msg.lower() or "accept" in error_msg.lower():
+            return None, {
+                "success": False,
+                "error": f"Model access denied. Please visit https://hf.co/pyannote/speech-separation-ami-1.0 to accept the user conditions. Original error: {error_msg}"
+            }
+        elif "authentication" in error_msg.lower() or "token" in error_msg.lower():
+            return None, {
+                "success": False,
+                "error": f"Authentication failed. Please check your HUGGINGFACE_TOKEN. Original error: {error_msg}"
+            }
+        else:
+            return None, {
+                "success": False,
+                "error": f"Failed to load pipeline: {error_msg}"
+            }
+    
+    return pipeline, None
 
 
 def separate_speakers(audio_path, output_dir=None):
@@ -45,6 +195,10 @@ def separate_speakers(audio_path, output_dir=None):
         dict with separation results
     """
     try:
+        import_error = import_heavy_modules()
+        if import_error:
+            return import_error
+        
         # Get HuggingFace token
         hf_token = os.getenv("HUGGINGFACE_TOKEN")
         if not hf_token:
@@ -58,139 +212,62 @@ def separate_speakers(audio_path, output_dir=None):
         print(f"Using device: {device}", file=sys.stderr)
         sys.stderr.flush()
         
-        # Check cache before loading
-        cache_dir = os.path.expanduser("~/.cache/huggingface/hub")
-        model_cache_path = os.path.join(cache_dir, "models--pyannote--speech-separation-ami-1.0")
-        
-        was_cached = os.path.exists(model_cache_path)
-        if was_cached:
-            print("✅ Model found in cache, loading from cache...", file=sys.stderr)
-            sys.stderr.flush()
-        else:
-            print("📥 Model not in cache, will download from Hugging Face...", file=sys.stderr)
-            print("⏳ This may take 5-10 minutes on first run (depending on internet speed)...", file=sys.stderr)
-            sys.stderr.flush()
-        
-        # Heartbeat for long operations
-        loading_complete = threading.Event()
-        heartbeat_count = [0]
-        
-        def heartbeat():
-            """Print heartbeat messages while model is loading"""
-            while not loading_complete.wait(30):  # Every 30 seconds
-                heartbeat_count[0] += 1
-                msg = f"⏳ [Progress {heartbeat_count[0] * 30}s] Still downloading/loading model...\n"
-                sys.stderr.write(msg)
-                sys.stderr.flush()
-        
-        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
-        heartbeat_thread.start()
-        
-        # Load pipeline
-        print("🔄 Starting model loading process...", file=sys.stderr)
-        sys.stderr.flush()
-        
-        try:
-            print("📦 Calling Pipeline.from_pretrained()...", file=sys.stderr)
-            sys.stderr.flush()
-            
-            pipeline = Pipeline.from_pretrained(
-                "pyannote/speech-separation-ami-1.0",
-                use_auth_token=hf_token
-            )
-            
-            loading_complete.set()  # Stop heartbeat
-            
-            # Check if model was downloaded and show cache size
-            if not was_cached and os.path.exists(model_cache_path):
-                # Calculate cache size
-                total_size = 0
-                for dirpath, dirnames, filenames in os.walk(model_cache_path):
-                    for f in filenames:
-                        fp = os.path.join(dirpath, f)
-                        try:
-                            total_size += os.path.getsize(fp)
-                        except:
-                            pass
-                size_mb = total_size / (1024 * 1024)
-                print(f"✅ Model successfully downloaded and cached! ({size_mb:.1f} MB)", file=sys.stderr)
-                sys.stderr.flush()
-            
-            if pipeline is None:
-                return {
-                    "success": False,
-                    "error": "Failed to load pipeline. The model might be gated. Please:\n1. Visit https://hf.co/pyannote/speech-separation-ami-1.0 to accept the user conditions\n2. Make sure your HUGGINGFACE_TOKEN is valid and has access to this model"
-                }
-            
-            print("🔄 Moving pipeline to device...", file=sys.stderr)
-            sys.stderr.flush()
-            pipeline.to(device)
-            print("✅ Model loaded successfully and ready to use!", file=sys.stderr)
-            sys.stderr.flush()
-            
-        except Exception as e:
-            loading_complete.set()  # Stop heartbeat on error
-            error_msg = str(e)
-            if "gated" in error_msg.lower() or "accept" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": f"Model access denied. Please visit https://hf.co/pyannote/speech-separation-ami-1.0 to accept the user conditions. Original error: {error_msg}"
-                }
-            elif "authentication" in error_msg.lower() or "token" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": f"Authentication failed. Please check your HUGGINGFACE_TOKEN. Original error: {error_msg}"
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Failed to load pipeline: {error_msg}"
-                }
+        pipeline = _PIPELINE_CACHE.get(str(device))
+        if pipeline is None:
+            pipeline, error_result = load_pipeline(hf_token, device)
+            if error_result:
+                return error_result
+            _PIPELINE_CACHE[str(device)] = pipeline
         
         # Load audio using soundfile directly to avoid torchcodec dependency
         print(f"Loading audio from {audio_path}...", file=sys.stderr)
-        sys.stderr.flush()
         
         try:
             import soundfile as sf
             # Load audio using soundfile directly
-            data, sample_rate = sf.read(audio_path, dtype='float32')
-            # Convert to torch tensor
-            if len(data.shape) == 1:
-                # Mono audio
-                waveform = torch.from_numpy(data).unsqueeze(0).float()
+            data, sample_rate = sf.read(audio_path, dtype='float32', always_2d=True)
+            if data.shape[1] == 1:
+                # Mono: the single column is already contiguous, no copy and no mean
+                waveform = torch.from_numpy(data[:, 0]).unsqueeze(0)
             else:
-                # Multi-channel audio - transpose to (channels, samples)
-                waveform = torch.from_numpy(data).transpose(0, 1).float()
+                # Downmix straight into a contiguous (samples,) array instead of
+                # transposing the whole (channels, samples) block first
+                waveform = torch.from_numpy(data.mean(axis=1)).unsqueeze(0)
             
             print(f"Loaded audio with soundfile: shape={waveform.shape}, sample_rate={sample_rate}", file=sys.stderr)
-            sys.stderr.flush()
         except ImportError:
             # Fallback to torchaudio if soundfile not available
             print("Warning: soundfile not available, trying torchaudio...", file=sys.stderr)
-            sys.stderr.flush()
             waveform, sample_rate = torchaudio.load(audio_path)
         except Exception as load_error:
             print(f"Error loading with soundfile: {load_error}, trying torchaudio...", file=sys.stderr)
-            sys.stderr.flush()
             waveform, sample_rate = torchaudio.load(audio_path)
         
         # Convert to mono if needed
         if waveform.shape[0] > 1:
             waveform = torch.mean(waveform, dim=0, keepdim=True)
         
-        # Resample to 16kHz if needed
+        # Resample to 16kHz if needed, on the GPU when there is one; the pipeline
+        # itself expects a CPU waveform, so only the (smaller) result is copied back
         if sample_rate != 16000:
-            resampler = torchaudio.transforms.Resample(sample_rate, 16000)
-            waveform = resampler(waveform)
+            resampler = _RESAMPLER_CACHE.get((sample_rate, str(device)))
+            if resampler is None:
+                if julius is not None:
+                    resampler = julius.ResampleFrac(sample_rate, 16000)
+                else:
+                    resampler = torchaudio.transforms.Resample(sample_rate, 16000)
+                resampler = resampler.to(device)
+                _RESAMPLER_CACHE[(sample_rate, str(device))] = resampler
+            # no_grad rather than inference_mode: the result is handed to the pipeline
+            # outside this block, and inference tensors cannot be used there
+            with torch.no_grad():
+                waveform = resampler(waveform.to(device)).cpu()
             sample_rate = 16000
         
         print(f"Audio shape: {waveform.shape}, Sample rate: {sample_rate}", file=sys.stderr)
-        sys.stderr.flush()
         
         # Run separation
         print("Running speaker separation...", file=sys.stderr)
-        sys.stderr.flush()
         diarization, sources = pipeline({
             "waveform": waveform,
             "sample_rate": sample_rate
@@ -199,30 +276,18 @@ def separate_speakers(audio_path, output_dir=None):
         # Get speakers
         speakers = list(diarization.labels())
         print(f"Found {len(speakers)} speakers: {speakers}", file=sys.stderr)
-        sys.stderr.flush()
         
         # Debug: Check sources structure
-        print(f"Sources type: {type(sources)}", file=sys.stderr)
-        print(f"Sources has 'data' attribute: {hasattr(sources, 'data')}", file=sys.stderr)
-        if hasattr(sources, 'data'):
-            print(f"Sources.data type: {type(sources.data)}", file=sys.stderr)
-            if hasattr(sources.data, 'shape'):
-                print(f"Sources.data shape: {sources.data.shape}", file=sys.stderr)
-            elif isinstance(sources.data, (list, tuple)):
-                print(f"Sources.data length: {len(sources.data)}", file=sys.stderr)
-        
-        # Check if sources is a SlidingWindowFeature and how to access speaker data
-        if hasattr(sources, '__getitem__'):
-            print(f"Sources supports indexing", file=sys.stderr)
-            try:
-                test_item = sources[0]
-                print(f"Sources[0] type: {type(test_item)}, shape: {getattr(test_item, 'shape', 'N/A')}", file=sys.stderr)
-            except:
-                pass
-        
-        # Check if sources has channels or other attributes
-        print(f"Sources attributes: {[attr for attr in dir(sources) if not attr.startswith('_')][:20]}", file=sys.stderr)
-        sys.stderr.flush()
+        if os.getenv("PYANNOTE_DEBUG"):
+            print(f"Sources type: {type(sources)}", file=sys.stderr)
+            print(f"Sources has 'data' attribute: {hasattr(sources, 'data')}", file=sys.stderr)
+            if hasattr(sources, 'data'):
+                print(f"Sources.data type: {type(sources.data)}", file=sys.stderr)
+                if hasattr(sources.data, 'shape'):
+                    print(f"Sources.data shape: {sources.data.shape}", file=sys.stderr)
+                elif isinstance(sources.data, (list, tuple)):
+                    print(f"Sources.data length: {len(sources.data)}", file=sys.stderr)
+            print(f"Sources attributes: {[attr for attr in dir(sources) if not attr.startswith('_')][:20]}", file=sys.stderr)
         
         # Create output directory if specified
         if output_dir:
@@ -271,17 +336,15 @@ def separate_speakers(audio_path, output_dir=None):
         sources_data = sources.data  # Shape: (samples, channels) - channels should be num_speakers
         
         print(f"Extracting audio for {len(speakers)} speakers from sources with shape {sources_data.shape}", file=sys.stderr)
-        sys.stderr.flush()
         
         # Check if sources has multiple channels (one per speaker)
         if sources_data.shape[1] == len(speakers):
             # Each channel corresponds to a speaker
             print("Using channel-based separation (each channel = one speaker)", file=sys.stderr)
-            sys.stderr.flush()
             for s, speaker in enumerate(speakers):
                 try:
                     # Get audio for this speaker from the corresponding channel
-                    speaker_audio = sources_data[:, s].astype(np.float32)
+                    speaker_audio = sources_data[:, s].astype(np.float32, copy=False)
                     
                     # Save to file
                     output_path = os.path.join(output_dir, f"{speaker}.wav")
@@ -294,20 +357,17 @@ def separate_speakers(audio_path, output_dir=None):
                         "isBackground": False
                     })
                     print(f"Saved {speaker} audio: {len(speaker_audio)} samples", file=sys.stderr)
-                    sys.stderr.flush()
                 except Exception as speaker_error:
                     print(f"Error processing speaker {speaker}: {speaker_error}", file=sys.stderr)
-                    sys.stderr.flush()
                     import traceback
                     traceback.print_exc(file=sys.stderr)
                     continue
         else:
             # Single channel - need to extract segments based on diarization
             print("Using diarization-based segmentation (single channel, extracting segments)", file=sys.stderr)
-            sys.stderr.flush()
             
             # Get the single channel audio
-            mixed_audio = sources_data[:, 0].astype(np.float32)
+            mixed_audio = sources_data[:, 0].astype(np.float32, copy=False)
             total_samples = len(mixed_audio)
             duration = total_samples / sample_rate
             
@@ -355,10 +415,8 @@ def separate_speakers(audio_path, output_dir=None):
                         "isBackground": False
                     })
                     print(f"Saved {speaker} audio: {len(speaker_audio)} samples, {len(speaker_segments)} segments", file=sys.stderr)
-                    sys.stderr.flush()
                 except Exception as speaker_error:
                     print(f"Error processing speaker {speaker}: {speaker_error}", file=sys.stderr)
-                    sys.stderr.flush()
                     import traceback
                     traceback.print_exc(file=sys.stderr)
                     continue
@@ -382,23 +440,55 @@ def separate_speakers(audio_path, output_dir=None):
         }
 
 
+def serve():
+    """
+    Persistent worker mode: reads one JSON job per line from stdin
+    ({"audio_path": ..., "output_dir": ...}) and writes one JSON result per
+    line to stdout. The pipeline is loaded on the first job and reused.
+    """
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+            audio_path = request["audio_path"]
+        except (ValueError, KeyError, TypeError) as e:
+            result = {"success": False, "error": f"Invalid request: {e}"}
+        else:
+            if not os.path.exists(audio_path):
+                result = {"success": False, "error": f"Audio file not found: {audio_path}"}
+            else:
+                result = separate_speakers(audio_path, request.get("output_dir"))
+        emit_result(result)
+
+
 def main():
     parser = argparse.ArgumentParser(description="PyAnnote Speaker Separation")
-    parser.add_argument("audio_path", help="Path to input audio file")
+    parser.add_argument("audio_path", nargs="?", help="Path to input audio file")
     parser.add_argument("--output-dir", help="Directory to save output files", default=None)
+    parser.add_argument("--server", action="store_true",
+                        help="Run as a persistent worker reading JSON jobs from stdin")
     
     args = parser.parse_args()
     
+    if args.server:
+        serve()
+        return
+    
+    if not args.audio_path:
+        parser.error("audio_path is required unless --server is given")
+    
     if not os.path.exists(args.audio_path):
         result = {
             "success": False,
             "error": f"Audio file not found: {args.audio_path}"
         }
-        print(json.dumps(result))
+        emit_result(result)
         sys.exit(1)
     
     result = separate_speakers(args.audio_path, args.output_dir)
-    print(json.dumps(result))
+    emit_result(result)
     
     if not result.get("success"):
         sys.exit(1)
@@ -0,0 +1,14 @@
+"""
+Small per-speaker aggregation helpers shared by the diagnostic scripts.
+Depends on numpy only.
+"""
+
+import numpy as np
+
+
+def aggregate_by_speaker(speakers, values):
+    """Сумує values по спікерах одним np.bincount замість Python-циклу зі словником"""
+    values = np.asarray(values)
+    labels, inverse = np.unique(np.asarray(speakers), return_inverse=True)
+    totals = np.bincount(inverse, weights=values, minlength=len(labels)).astype(values.dtype, copy=False)
+    return dict(zip(labels.tolist(), totals.tolist()))
@@ -8,27 +8,79 @@ rest of the pipeline.
 
 Usage:
     python speechbrain_separation.py <audio_path> <output_dir>
+    python speechbrain_separation.py --server
 """
 
 import sys
 import os
 import json
 import tempfile
+import itertools
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 
-import torch
-import pyannote_patch  # noqa: F401  # ensures torchaudio compatibility on Python 3.14+
-import torchaudio
-import soundfile as sf
-from speechbrain.inference.separation import (
-    SepformerSeparation as Separator,
-)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+TARGET_SAMPLE_RATE = 8000  # sepformer-wsj02mix is trained on 8 kHz audio
+MIN_SEPARATION_SAMPLES = TARGET_SAMPLE_RATE  # shorter inputs are zero-padded to 1 s
+RESAMPLE_CONTEXT_SECONDS = 0.02
+
+# Resamplers built in this process, keyed by (source_rate, device)
+_RESAMPLERS = {}
+
+# Speaker permutation index tensors, keyed by (num_speakers, device)
+_PERMUTATIONS = {}
+
+# Cross-fade (fade_in, fade_out) Hann halves, keyed by (overlap_samples, device)
+_FADE_WINDOWS = {}
+
+# Models loaded in this process, keyed by device (reused in --server mode),
+# and the (device, batch, chunk) shapes the model was warmed up on
+_MODEL_CACHE = {}
+_WARMED_SHAPES = set()
 
 
 def log_error(message):
     print(message, file=sys.stderr)
 
 
+def emit_result(result):
+    """Writes result to stdout as one JSON line, via orjson when it is installed."""
+    if orjson is not None:
+        sys.stdout.buffer.write(orjson.dumps(result) + b"\n")
+    else:
+        sys.stdout.write(json.dumps(result) + "\n")
+    sys.stdout.flush()
+
+
+def import_heavy_modules():
+    """
+    Imports torch, torchaudio, soundfile and SpeechBrain into module globals.
+    Deferred until separation actually runs, so usage and missing-file errors
+    return without paying several seconds of import time.
+    """
+    global torch, torchaudio, sf, Separator, julius
+    if "torch" in globals():
+        return
+    import torch
+    import pyannote_patch  # noqa: F401  # ensures torchaudio compatibility on Python 3.14+
+    import torchaudio
+    import soundfile as sf
+    from speechbrain.inference.separation import (
+        SepformerSeparation as Separator,
+    )
+    try:
+        import julius
+    except ImportError:
+        julius = None
+
+
 def ensure_output_dir(path: str) -> str:
     if not path:
         return tempfile.mkdtemp(prefix="speechbrain_separation_")
@@ -53,8 +105,20 @@ def load_waveform(audio_path: str):
     Prefers soundfile to avoid torchcodec dependency, falls back to torchaudio.
     """
     try:
-        data, sample_rate = sf.read(audio_path, dtype='float32', always_2d=True)
-        waveform = torch.from_numpy(data.T)
+        # One open for header and data; samples are decoded straight into the tensor's memory
+        with sf.SoundFile(audio_path) as f:
+            sample_rate = f.samplerate
+            waveform = torch.empty(1, f.frames)
+            mono = waveform[0].numpy()
+            if f.channels == 1:
+                frames = len(f.read(dtype='float32', out=mono))
+            else:
+                # Downmix block by block so the full [frames, channels] array is never held
+                frames = 0
+                for block in f.blocks(blocksize=65536, dtype='float32', always_2d=True):
+                    block.mean(axis=1, out=mono[frames:frames + len(block)])
+                    frames += len(block)
+        waveform = waveform[:, :frames]
         log_error(f"[SpeechBrain] Loaded via soundfile: shape={waveform.shape}, sr={sample_rate}")
         return waveform, sample_rate
     except Exception as sf_error:
@@ -63,17 +127,201 @@ def load_waveform(audio_path: str):
         return waveform, sample_rate
 
 
-def apply_spectral_gating(separated_sources, mixture, gate_threshold=0.1, gate_alpha=0.5):
+def get_resampler(source_rate: int, device):
+    """
+    Returns a cached module resampling source_rate -> TARGET_SAMPLE_RATE on device.
+
+    julius' ResampleFrac (a single conv1d with a precomputed sinc kernel) is
+    used when installed, unless SPEECHBRAIN_JULIUS=0; torchaudio's Resample
+    otherwise. Caching per (source_rate, device) builds the kernel only once.
+    """
+    key = (source_rate, str(device))
+    resampler = _RESAMPLERS.get(key)
+    if resampler is None:
+        if julius is not None and os.getenv("SPEECHBRAIN_JULIUS", "1") != "0":
+            resampler = julius.ResampleFrac(source_rate, TARGET_SAMPLE_RATE)
+        else:
+            resampler = torchaudio.transforms.Resample(source_rate, TARGET_SAMPLE_RATE)
+        resampler = resampler.to(device)
+        _RESAMPLERS[key] = resampler
+    return resampler
+
+
+class ChunkDataset:
+    """
+    Reads overlapping mono chunks out of an audio file, so only one chunk of
+    decoded audio is held in memory at a time.
+
+    Map-style dataset (__len__/__getitem__) for torch's DataLoader; it is a
+    plain class so that defining it does not require importing torch.
+
+    Chunks come back at the file's own sample rate, as (start, chunk, offset):
+    start is the chunk position at TARGET_SAMPLE_RATE, and each chunk carries a
+    little extra context on both sides so the resampling filter (run on the
+    device by the caller) does not see hard edges; after resampling the chunk
+    starts at offset. When soundfile cannot open the file, the whole waveform
+    is loaded via torchaudio, resampled once and sliced instead.
+
+    Chunk length is balanced over the file: instead of max_chunk_samples
+    chunks plus a short tail, the file is split into the fewest equal chunks
+    of at most max_chunk_samples (see chunk_samples / overlap_samples).
+    """
+
+    def __init__(self, audio_path: str, max_chunk_samples: int, overlap_samples: int):
+        self.audio_path = audio_path
+        self.waveform = None
+        try:
+            info = sf.info(audio_path)
+            self.source_rate = info.samplerate
+            self.source_frames = info.frames
+            self.channels = info.channels
+            self.total_samples = info.frames * TARGET_SAMPLE_RATE // info.samplerate
+            log_error(
+                f"[SpeechBrain] Streaming via soundfile: frames={info.frames}, "
+                f"sr={info.samplerate}, channels={info.channels}"
+            )
+        except Exception as sf_error:
+            log_error(f"[SpeechBrain] soundfile info failed ({sf_error}), loading whole file")
+            waveform, sample_rate = load_waveform(audio_path)
+            if waveform.shape[0] > 1:
+                waveform = waveform.mean(dim=0, keepdim=True)
+            if sample_rate != TARGET_SAMPLE_RATE:
+                log_error(f"[SpeechBrain] Resampling from {sample_rate}Hz to {TARGET_SAMPLE_RATE}Hz")
+                waveform = get_resampler(sample_rate, "cpu")(waveform)
+            self.waveform = waveform
+            self.source_rate = TARGET_SAMPLE_RATE
+            self.channels = 1
+            self.total_samples = waveform.shape[1]
+        # Fewest chunks that cover the file with the given overlap, all of equal length,
+        # so a 31 s file becomes 2 x ~16.5 s instead of 30 s plus an unstable 1 s tail
+        num_chunks = max(1, math.ceil(
+            (self.total_samples - overlap_samples) / (max_chunk_samples - overlap_samples)
+        ))
+        self.chunk_samples = min(
+            math.ceil((self.total_samples - overlap_samples) / num_chunks) + overlap_samples,
+            max_chunk_samples,
+        )
+        # Balanced chunks may be shorter; keep the overlap within half a chunk
+        self.overlap_samples = max(1, min(overlap_samples, self.chunk_samples // 2))
+        hop_samples = self.chunk_samples - self.overlap_samples
+
+        # Chunks advance by hop_samples; the last one is the first that reaches the end
+        self.starts = []
+        if self.total_samples > 0:
+            self.starts.append(0)
+            while self.starts[-1] + self.chunk_samples < self.total_samples:
+                self.starts.append(self.starts[-1] + hop_samples)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        import_heavy_modules()  # no-op unless running in a freshly spawned worker
+        start = self.starts[index]
+
+        if self.waveform is not None:
+            return start, self.waveform[:, start:start + self.chunk_samples].clone(), 0
+
+        ratio = self.source_rate / TARGET_SAMPLE_RATE
+        context = 0
+        if self.source_rate != TARGET_SAMPLE_RATE:
+            context = int(self.source_rate * RESAMPLE_CONTEXT_SECONDS)
+
+        length = min(self.chunk_samples, self.total_samples - start)
+        frame_start = int(start * ratio)
+        frame_end = min(int((start + length) * ratio), self.source_frames)
+        read_start = max(frame_start - context, 0)
+        read_end = min(frame_end + context, self.source_frames)
+
+        with sf.SoundFile(self.audio_path) as f:
+            f.seek(read_start)
+            if self.channels == 1:
+                block = f.read(read_end - read_start, dtype='float32')
+            else:
+                block = f.read(read_end - read_start, dtype='float32', always_2d=True).mean(axis=1)
+        chunk = torch.from_numpy(block).unsqueeze(0)
+        return start, chunk, round((frame_start - read_start) / ratio)
+
+
+def get_autocast_dtype(device: str):
+    """
+    Returns the reduced-precision dtype used for the SepFormer forward pass,
+    or None when the model should run in full FP32.
+
+    SPEECHBRAIN_AUTOCAST=fp16|bf16|off overrides the per-device default:
+    BF16 on CUDA GPUs that support it (FP16 on older ones), FP16 on MPS and
+    FP32 on CPU, where BF16 only pays off on CPUs with AMX/AVX512-BF16.
+    """
+    override = os.getenv("SPEECHBRAIN_AUTOCAST", "").lower()
+    if override in ("off", "fp32", "0"):
+        return None
+    if override == "fp16":
+        return torch.float16
+    if override == "bf16":
+        return torch.bfloat16
+
+    device_type = torch.device(device).type
+    if device_type == "cuda":
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    if device_type == "mps":
+        return torch.float16
+    return None
+
+
+def compile_masknet(model):
+    """
+    Compiles the SepFormer masknet with torch.compile to cut Python dispatch
+    overhead between kernels. Falls back to eager mode if compilation is
+    unavailable or fails.
+    """
+    if not hasattr(torch, "compile"):
+        log_error("[SpeechBrain] torch.compile not available, running eager")
+        return False
+    try:
+        # Batches are always padded to the warm-up shape, so static shapes are safe
+        # and let Inductor specialise kernels instead of tracing symbolic sizes
+        model.mods.masknet = torch.compile(
+            model.mods.masknet, mode="reduce-overhead", fullgraph=False, dynamic=False
+        )
+        return True
+    except Exception as compile_error:
+        log_error(f"[SpeechBrain] torch.compile failed ({compile_error}), running eager")
+        return False
+
+
+def quantize_masknet(model):
+    """
+    Applies int8 dynamic quantization to the Linear layers of the SepFormer
+    masknet for CPU inference. The conv encoder/decoder stay in FP32, since
+    quantizing the waveform convolutions hurts quality. Falls back to FP32
+    if quantization is unavailable or fails.
+    """
+    try:
+        model.mods.masknet = torch.ao.quantization.quantize_dynamic(
+            model.mods.masknet, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        return True
+    except Exception as quantize_error:
+        log_error(f"[SpeechBrain] int8 quantization failed ({quantize_error}), running FP32")
+        return False
+
+
+def apply_spectral_gating(separated_sources, mixture, gate_threshold=0.1, gate_alpha=0.5, gate_stats=None, chunk_lengths=None):
     """
     Застосовує спектральне гейтування для покращення розділення одночасних голосів.
     Видаляє залишки іншого спікера з кожного джерела.
     Використовується тільки в debug режимі для покращення якості розділення.
     
     Args:
-        separated_sources: Tensor форми [num_speakers, time] - розділені джерела
-        mixture: Tensor форми [1, time] - оригінальна суміш
+        separated_sources: Tensor форми [num_speakers, time] - розділені джерела,
+            або батч чанків [batch, num_speakers, time] (обробляється одним проходом)
+        mixture: Tensor форми [1, time] (або [batch, time]) - оригінальна суміш
         gate_threshold: Поріг для гейтування (0.0-1.0). Менше значення = агресивніше пригнічення.
         gate_alpha: Коефіцієнт для м'якого гейтування (0.0-1.0). Менше значення = м'якше приглушення.
+        gate_stats: Необов'язковий список; якщо передано, середні значення маски по чанках додаються
+            туди одним тензором на пристрої (без синхронізації з GPU) замість логування тут.
+        chunk_lengths: Для батчу - реальні довжини чанків; рядки й семпли доповнення
+            (нульові рядки та хвости батчу фіксованої форми) не входять у статистику.
     
     Returns:
         Покращені розділені джерела
@@ -81,53 +329,101 @@ def apply_spectral_gating(separated_sources, mixture, gate_threshold=0.1, gate_a
     if separated_sources.numel() == 0 or mixture.numel() == 0:
         return separated_sources
     
-    # Нормалізуємо форму separated_sources до [num_speakers, time]
-    if separated_sources.dim() == 3:
-        # [batch, num_speakers, time] -> беремо перший batch
-        separated_sources = separated_sources[0]
-    
+    # [batch, num_speakers, time] залишаємо як є: всі чанки гейтуються разом по осі спікерів
     if separated_sources.dim() == 2:
         # Можливо [time, num_speakers] - транспонуємо якщо потрібно
         if separated_sources.shape[0] > separated_sources.shape[1] and separated_sources.shape[1] <= 10:
             # Схоже на [time, num_speakers]
             separated_sources = separated_sources.transpose(0, 1)
     
-    # Переконуємося, що mixture має форму [1, time]
+    # Переконуємося, що mixture має форму [1, time] для одного чанку
     if mixture.dim() == 1:
         mixture = mixture.unsqueeze(0)
-    elif mixture.dim() == 2 and mixture.shape[0] > 1:
+    elif mixture.dim() == 2 and mixture.shape[0] > 1 and separated_sources.dim() == 2:
         # [channels, time] -> беремо перший канал і робимо [1, time]
         mixture = mixture[0:1]
     
-    # Обчислюємо енергію кожного джерела
-    sources_energy = torch.abs(separated_sources)
-    
-    # Обчислюємо відносну енергію кожного джерела відносно загальної енергії всіх джерел
-    total_energy = sources_energy.sum(dim=0, keepdim=True) + 1e-8
-    relative_energy = sources_energy / total_energy
+    # Відносна енергія кожного джерела: |s_i| / sum_j |s_j|, рахуємо in-place в одному буфері
+    gate_mask = separated_sources.abs()
+    inv_total_energy = gate_mask.sum(dim=-2, keepdim=True).add_(1e-8).reciprocal_()
+    gate_mask.mul_(inv_total_energy)
     
-    # Створюємо м'яку маску гейтування
-    # Джерела з високою відносною енергією зберігаються, з низькою - приглушуються
-    gate_mask = torch.clamp((relative_energy - gate_threshold) / (1.0 - gate_threshold + 1e-8), 0, 1)
-    gate_mask = gate_alpha + (1.0 - gate_alpha) * gate_mask
+    # М'яка маска гейтування: джерела з високою відносною енергією зберігаються, з низькою - приглушуються
+    gate_mask.sub_(gate_threshold).mul_(1.0 / (1.0 - gate_threshold + 1e-8)).clamp_(0, 1)
+    gate_mask.mul_(1.0 - gate_alpha).add_(gate_alpha)
     
-    # Застосовуємо маску
-    gated_sources = separated_sources * gate_mask
+    # Застосовуємо маску in-place
+    gated_sources = separated_sources.mul_(gate_mask)
     
-    # Логуємо статистику
-    avg_gate_value = gate_mask.mean().item()
-    log_error(f"[SpeechBrain] Spectral gating applied: avg_gate={avg_gate_value:.3f}, threshold={gate_threshold:.3f}, alpha={gate_alpha:.3f}")
+    # Логуємо статистику (або відкладаємо її, щоб .item() не зупиняв GPU на кожному чанку)
+    if gate_stats is not None:
+        if gate_mask.dim() == 3 and chunk_lengths is not None:
+            gate_stats.append(torch.stack([
+                gate_mask[row, :, :length].mean() for row, length in enumerate(chunk_lengths)
+            ]))
+        elif gate_mask.dim() == 3:
+            gate_stats.append(gate_mask.mean(dim=(1, 2)))
+        else:
+            gate_stats.append(gate_mask.mean().reshape(1))
+    else:
+        avg_gate_value = gate_mask.mean().item()
+        log_error(f"[SpeechBrain] Spectral gating applied: avg_gate={avg_gate_value:.3f}, threshold={gate_threshold:.3f}, alpha={gate_alpha:.3f}")
     
     return gated_sources
 
 
-def separate(audio_path: str, output_dir: str):
-    device = get_device()
+def align_channels(prev_overlap, chunk_result, overlap_samples):
+    """
+    Reorders the speakers of chunk_result to match the previous chunk.
+
+    SepFormer assigns speaker order arbitrarily on every call, so the overlap
+    region shared by two neighbouring chunks is used to pick the permutation
+    with the highest total cosine similarity against the previous chunk's tail.
+    Cosine similarity ignores per-chunk gain differences, so a loud speaker
+    cannot outvote the actual waveform match of a quiet one.
+
+    Args:
+        prev_overlap: Tensor [num_speakers, overlap] - unfaded tail of the previous chunk
+        chunk_result: Tensor [num_speakers, time] - current chunk, unfaded
+        overlap_samples: Number of samples shared by the two chunks
+
+    Returns:
+        chunk_result with its speaker rows permuted
+    """
+    curr_overlap = chunk_result[:, :overlap_samples]
+    overlap = min(prev_overlap.shape[1], curr_overlap.shape[1])
+    # corr[i, j] = cos(previous speaker i, current speaker j) over the shared samples
+    prev_unit = torch.nn.functional.normalize(prev_overlap[:, :overlap], dim=1)
+    curr_unit = torch.nn.functional.normalize(curr_overlap[:, :overlap], dim=1)
+    corr = prev_unit @ curr_unit.T
+    num_speakers = corr.shape[0]
+
+    # Exhaustive search equals the Hungarian assignment for SepFormer's 2-3 speakers.
+    # All permutations are scored at once and the winner is picked on the device,
+    # so alignment never waits for the GPU: scores[p] = sum_i corr[i, perms[p, i]]
+    key = (num_speakers, str(corr.device))
+    perms = _PERMUTATIONS.get(key)
+    if perms is None:
+        perms = torch.tensor(list(itertools.permutations(range(num_speakers))), device=corr.device)
+        _PERMUTATIONS[key] = perms
+    scores = corr.gather(1, perms.T).sum(dim=0)
+    return chunk_result.index_select(0, perms[scores.argmax()])
+
+
+def load_model(device):
+    """
+    Loads the SepFormer separator onto device, or returns the one already
+    loaded in this process.
+
+    Returns:
+        (model, compiled) - compiled tells whether the masknet was torch.compile'd
+    """
+    if device in _MODEL_CACHE:
+        return _MODEL_CACHE[device]
+
     cache_dir = os.path.expanduser(
         os.getenv("SPEECHBRAIN_CACHE_DIR", "~/.cache/speechbrain/sepformer-wsj02mix")
     )
-
-    log_error(f"[SpeechBrain] Using device: {device}")
     log_error(f"[SpeechBrain] Cache dir: {cache_dir}")
 
     model = Separator.from_hparams(
@@ -135,20 +431,44 @@ def separate(audio_path: str, output_dir: str):
         savedir=cache_dir,
         run_opts={"device": device},
     )
-
-    waveform, sample_rate = load_waveform(audio_path)
-
-    if waveform.shape[0] > 1:
-        waveform = waveform.mean(dim=0, keepdim=True)
-
-    if sample_rate != 8000:
-        log_error(f"[SpeechBrain] Resampling from {sample_rate}Hz to 8000Hz")
-        resampler = torchaudio.transforms.Resample(sample_rate, 8000)
-        waveform = resampler(waveform)
-        sample_rate = 8000
-
-    total_samples = waveform.shape[1]
-    
+    model.eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    if torch.device(device).type == "cpu" and os.getenv("SPEECHBRAIN_QUANTIZE") == "1":
+        if quantize_masknet(model):
+            log_error("[SpeechBrain] masknet Linear layers quantized to int8")
+    if torch.device(device).type == "cuda":
+        # Chunks are padded to a fixed width, so cuDNN autotunes the encoder/decoder
+        # convolutions once and reuses the fastest algorithms for every batch
+        torch.backends.cudnn.benchmark = True
+    # Compiled by default on CUDA only; MPS and CPU gain little and compile slowly
+    compile_default = "1" if torch.device(device).type == "cuda" else "0"
+    compiled = os.getenv("SPEECHBRAIN_COMPILE", compile_default) == "1" and compile_masknet(model)
+
+    _MODEL_CACHE[device] = (model, compiled)
+    return model, compiled
+
+
+@dataclass(frozen=True)
+class SeparationConfig:
+    """Separation settings for one job, resolved once by load_separation_config()."""
+
+    debug_mode: bool
+    chunk_seconds: float
+    enable_spectral_gating: bool
+    gate_threshold: float
+    gate_alpha: float
+    overlap_seconds: float
+    silence_rms: float
+    output_subtype: str
+    stream_output: bool
+
+
+def load_separation_config():
+    """
+    Resolves the separation settings once per job into a SeparationConfig.
+    Priority: debug env vars > project config file > defaults.
+    """
     # Check if debug mode is enabled
     debug_mode = os.getenv("SPEECHBRAIN_DEBUG_MODE") == "1"
     
@@ -187,94 +507,364 @@ def separate(audio_path: str, output_dir: str):
             log_error(f"[SpeechBrain] Using project config: chunk={max_chunk_seconds}s, spectral_gating={'ON' if enable_spectral_gating else 'OFF'}, gate_threshold={gate_threshold}, gate_alpha={gate_alpha}")
         else:
             log_error(f"[SpeechBrain] Using default parameters: chunk={max_chunk_seconds}s, spectral_gating=OFF")
-    
-    max_chunk_samples = int(max_chunk_seconds * sample_rate)
-    max_chunk_samples = max(max_chunk_samples, sample_rate * 5)  # ensure at least 5 seconds
 
-    log_error(f"[SpeechBrain] Waveform shape before separation: {waveform.shape}, dtype={waveform.dtype}, chunk={max_chunk_samples} samples")
+    return SeparationConfig(
+        debug_mode=debug_mode,
+        chunk_seconds=max_chunk_seconds,
+        enable_spectral_gating=bool(enable_spectral_gating),
+        gate_threshold=gate_threshold,
+        gate_alpha=gate_alpha,
+        overlap_seconds=float(os.getenv("SPEECHBRAIN_OVERLAP_SECONDS", "2")),
+        silence_rms=float(os.getenv("SPEECHBRAIN_SILENCE_RMS", "1e-4")),
+        output_subtype=os.getenv("SPEECHBRAIN_OUTPUT_SUBTYPE", "PCM_16").upper(),
+        stream_output=os.getenv("SPEECHBRAIN_STREAM_OUTPUT") == "1",
+    )
 
-    def separate_chunk(chunk_tensor: torch.Tensor):
-        chunk_tensor = chunk_tensor.to(device)
-        with torch.no_grad():
-            result = model.separate_batch(chunk_tensor)
-        
-        # Apply spectral gating if enabled (in debug mode or if applied via project config)
-        if enable_spectral_gating:
-            # Store original shape for restoration if needed
-            original_shape = result.shape
-            # Apply spectral gating (requires original mixture)
-            result = apply_spectral_gating(
-                result, 
-                chunk_tensor, 
-                gate_threshold=gate_threshold,
-                gate_alpha=gate_alpha
-            )
-            # Ensure shape is preserved
-            if result.shape != original_shape:
-                log_error(f"[SpeechBrain] Warning: Shape changed after spectral gating: {original_shape} -> {result.shape}")
-        
-        return result.cpu()
 
-    if total_samples > max_chunk_samples:
-        log_error(f"[SpeechBrain] Processing in chunks (total samples {total_samples})")
-        chunk_outputs = []
-        for start in range(0, total_samples, max_chunk_samples):
-            end = min(start + max_chunk_samples, total_samples)
-            log_error(f"[SpeechBrain] Separating chunk {start}:{end}")
-            chunk = waveform[:, start:end]
-            chunk_outputs.append(separate_chunk(chunk))
-        est_sources = torch.cat(chunk_outputs, dim=1)
-    else:
-        est_sources = separate_chunk(waveform)
+def separate(audio_path: str, output_dir: str):
+    import_heavy_modules()
+    device = get_device()
+    log_error(f"[SpeechBrain] Using device: {device}")
 
-    if est_sources.dim() == 3:
-        est_sources = est_sources[0]  # [time, num_speakers]
+    model, compiled = load_model(device)
+    autocast_dtype = get_autocast_dtype(device)
 
-    if est_sources.dim() == 2:
-        if est_sources.shape[0] == model.hparams.num_spks:
-            # shape [num_speakers, time]
-            sources_tensor = est_sources
-        elif est_sources.shape[1] == model.hparams.num_spks:
-            sources_tensor = est_sources.transpose(0, 1)
-        else:
-            raise ValueError(f"Unexpected est_sources shape: {est_sources.shape}")
-    else:
-        raise ValueError(f"Unsupported est_sources dimension: {est_sources.dim()}")
+    sample_rate = TARGET_SAMPLE_RATE
+    
+    config = load_separation_config()
+
+    max_chunk_samples = int(config.chunk_seconds * sample_rate)
+    max_chunk_samples = max(max_chunk_samples, sample_rate * 5)  # ensure at least 5 seconds
 
-    if est_sources is None or len(est_sources) == 0:
+    # Neighbouring chunks share a short overlap (2 s by default, at most half a chunk)
+    # that is cross-faded with complementary Hann halves and used for speaker alignment
+    overlap_samples = min(max(int(config.overlap_seconds * sample_rate), 1), max_chunk_samples // 2)
+    num_speakers = model.hparams.num_spks
+
+    dataset = ChunkDataset(audio_path, max_chunk_samples, overlap_samples)
+    total_samples = dataset.total_samples
+    chunk_samples = dataset.chunk_samples
+    overlap_samples = dataset.overlap_samples
+    resampler = None
+    if dataset.source_rate != TARGET_SAMPLE_RATE:
+        log_error(f"[SpeechBrain] Resampling chunks from {dataset.source_rate}Hz to {TARGET_SAMPLE_RATE}Hz on {device}")
+        resampler = get_resampler(dataset.source_rate, device)
+    log_error(f"[SpeechBrain] Samples to separate: {total_samples} at {sample_rate}Hz, chunk={chunk_samples} samples, overlap={overlap_samples} samples")
+
+    batch_size = max(1, int(os.getenv(
+        "SPEECHBRAIN_BATCH_SIZE", "4" if torch.device(device).type == "cuda" else "1"
+    )))
+
+    # Per-chunk average gate values, kept on the device and logged once at the end
+    gate_stats = []
+
+    def separate_chunk(chunk_tensor: torch.Tensor, chunk_lengths=None):
+        """
+        Separates a [batch, time] tensor of chunks into [batch, num_speakers, time] on the device.
+        chunk_lengths (real length of each non-padding row) keeps padding out of the gating stats.
+        """
+        chunk_tensor = chunk_tensor.to(device, non_blocking=True)
+        # Gating runs in-place, so it must stay inside inference_mode with the model outputs
+        with torch.inference_mode():
+            # Same steps as model.separate_batch(), but only the transformer masknet
+            # runs under autocast: the conv encoder/decoder stay FP32 so the output
+            # waveform is not rounded to half precision
+            mix_w = model.mods.encoder(chunk_tensor)
+            with torch.autocast(
+                device_type=torch.device(device).type,
+                dtype=autocast_dtype,
+                enabled=autocast_dtype is not None,
+            ):
+                est_mask = model.mods.masknet(mix_w)
+            sep_h = mix_w.unsqueeze(0) * est_mask.float()
+            # [batch, num_speakers, time], padded/trimmed to the input length
+            result = torch.stack([model.mods.decoder(sep_h[i]) for i in range(num_speakers)], dim=1)
+            time_diff = chunk_tensor.shape[1] - result.shape[2]
+            if time_diff > 0:
+                result = torch.nn.functional.pad(result, (0, time_diff))
+            else:
+                result = result[:, :, :chunk_tensor.shape[1]]
+            
+            # Apply spectral gating on-device if enabled (in debug mode or if applied via project config)
+            if config.enable_spectral_gating:
+                # Apply spectral gating in-place to the whole batch at once (requires original mixture);
+                # a [batch, num_speakers, time] input keeps its shape, so no check is needed afterwards
+                apply_spectral_gating(
+                    result, 
+                    chunk_tensor, 
+                    gate_threshold=config.gate_threshold,
+                    gate_alpha=config.gate_alpha,
+                    gate_stats=gate_stats,
+                    chunk_lengths=chunk_lengths,
+                )
+            
+            return result
+
+    # Checked before the warm-up, which would otherwise run on a 0-row batch
+    if total_samples == 0:
         return {
             "success": False,
-            "error": "No speakers detected in audio",
+            "error": "Audio file contains no samples",
         }
 
-    speakers = []
-    timeline = []
+    # Pay the compilation cost (and, on CUDA, cuDNN's algorithm search) once per shape,
+    # on the same shape as the first real batch, so it never lands inside the chunk loop
+    if compiled:
+        warmup_shape = (batch_size, max_chunk_samples)
+    else:
+        warmup_shape = (min(batch_size, len(dataset)), max(MIN_SEPARATION_SAMPLES, chunk_samples))
+    if (compiled or torch.device(device).type == "cuda") and (device, *warmup_shape) not in _WARMED_SHAPES:
+        log_error(f"[SpeechBrain] Warming up the model on {warmup_shape[0]}x{warmup_shape[1]} samples")
+        separate_chunk(torch.zeros(*warmup_shape))
+        _WARMED_SHAPES.add((device, *warmup_shape))
+        gate_stats.clear()
+
+    if len(dataset) > 1:
+        log_error(f"[SpeechBrain] Processing in chunks (total samples {total_samples})")
 
-    for idx, source in enumerate(sources_tensor):
-        speaker_name = f"SPEAKER_{idx:02d}"
-        output_path = os.path.join(output_dir, f"{speaker_name}.wav")
+    # Stitching stays on the device; the result is copied to the host once at the end
+    fade_key = (overlap_samples, str(device))
+    if fade_key not in _FADE_WINDOWS:
+        fade_window = torch.hann_window(2 * overlap_samples, periodic=True, device=device)
+        _FADE_WINDOWS[fade_key] = (fade_window[:overlap_samples], fade_window[overlap_samples:])
+    fade_in, fade_out = _FADE_WINDOWS[fade_key]
+
+    # When streaming, output_buffer only spans one batch of chunks starting at the first
+    # unwritten sample (see flush_output), so memory no longer grows with the file length
+    buffer_samples = min(total_samples, batch_size * chunk_samples) if config.stream_output else total_samples
+    with torch.inference_mode():
+        output_buffer = torch.zeros(num_speakers, buffer_samples, device=device)
+    # On CUDA, files longer than one batch get two decode workers so reading and
+    # resampling context prep never stalls the GPU; short files skip the startup cost
+    default_workers = "2" if torch.device(device).type == "cuda" and len(dataset) > batch_size else "0"
+    loader = torch.utils.data.DataLoader(
+        dataset,
+        batch_size=None,
+        num_workers=int(os.getenv("SPEECHBRAIN_LOADER_WORKERS", default_workers)),
+        pin_memory=torch.device(device).type == "cuda",
+    )
+    # On CUDA, chunks are uploaded on a side stream while the previous batch computes
+    copy_stream = torch.cuda.Stream() if torch.device(device).type == "cuda" else None
+    prev_overlap = None
+
+    # Names, paths and the (shared) duration are computed once up front
+    output_root = Path(output_dir)
+    speaker_names = [f"SPEAKER_{idx:02d}" for idx in range(num_speakers)]
+    output_paths = [str(output_root / f"{speaker_name}.wav") for speaker_name in speaker_names]
+    duration = round(total_samples / sample_rate, 2)
+
+    # SPEECHBRAIN_STREAM_OUTPUT=1 writes each region of the output as soon as no later
+    # chunk can overlap it, on a background thread, instead of once at the end.
+    # Streamed tracks are clipped to full scale rather than peak-normalized.
+    finalized = 0
+    written = 0
+    stream_writer = None
+    stream_files = []
+    stream_writes = []
+    # Everything that can fail while the stream writer and output files are open runs
+    # under try/finally, so a failed job (e.g. in --server mode) leaks neither the
+    # writer thread nor file handles and leaves no truncated WAVs behind
+    completed = False
+    try:
+        if config.stream_output:
+            stream_writer = ThreadPoolExecutor(max_workers=1)
+            for output_path in output_paths:
+                stream_files.append(sf.SoundFile(
+                    output_path, mode="w", samplerate=sample_rate, channels=1, subtype=config.output_subtype
+                ))
+
+        def write_region(region):
+            """Runs on stream_writer: copies one finished region to the host and appends it."""
+            for stream_file, track in zip(stream_files, region.cpu().numpy()):
+                stream_file.write(track)
+
+        def flush_output():
+            """Hands every finalized but unwritten sample of output_buffer to stream_writer."""
+            nonlocal written
+            if stream_writer is None or finalized <= written:
+                return
+            finished = finalized - written
+            region = output_buffer[:, :finished].clamp(-1.0, 1.0)
+            if config.output_subtype == "PCM_16":
+                region = region.mul_(32767).round_().to(torch.int16)
+            # The device-to-host copy happens on the writer thread, so it never stalls the loop
+            stream_writes.append(stream_writer.submit(write_region, region))
+            # Slide the window: the overlap tail that the next chunk still adds into moves to the front
+            tail = output_buffer[:, finished:finished + overlap_samples].clone()
+            output_buffer.zero_()
+            output_buffer[:, :tail.shape[1]].copy_(tail)
+            written = finalized
+
+        def stitch(batch_starts, batch_silent, batch_result):
+            """Aligns, cross-fades and accumulates one separated batch into output_buffer."""
+            nonlocal prev_overlap, finalized
+            results = iter(batch_result if batch_result is not None else ())
+            for chunk_start, silent in zip(batch_starts, batch_silent):
+                # Everything before the next chunk's overlap is final once this chunk is added
+                chunk_end = min(chunk_start + chunk_samples, total_samples)
+                finalized = chunk_end if chunk_end == total_samples else chunk_end - overlap_samples
+                if silent:
+                    # Silent chunks are never separated; their span of output_buffer stays zero
+                    prev_overlap = None
+                    continue
+                # Batches are padded to batch_width (max_chunk_samples when compiled), so the
+                # result is trimmed to the real chunk before aligning, fading and accumulating
+                chunk_result = next(results)
+                length = min(chunk_samples, total_samples - chunk_start)
+                chunk_result = chunk_result[:, :length]
+                if chunk_start > 0 and prev_overlap is not None:
+                    chunk_result = align_channels(prev_overlap, chunk_result, overlap_samples)
+                prev_overlap = chunk_result[:, -overlap_samples:].clone()
+                # Cross-fade into the previous chunk / out of the next one; the fades sum to 1.
+                # narrow() + mul_/add_ avoid the extra copy-back that `view[...] *= w` issues.
+                fade_length = min(overlap_samples, length)
+                if chunk_start > 0:
+                    chunk_result.narrow(1, 0, fade_length).mul_(fade_in[:fade_length])
+                if chunk_start + length < total_samples:
+                    chunk_result.narrow(1, length - overlap_samples, overlap_samples).mul_(fade_out)
+                output_buffer.narrow(1, chunk_start - written, length).add_(chunk_result)
+            flush_output()
+
+        log_error(f"[SpeechBrain] Separating {len(dataset)} chunks in batches of up to {batch_size}")
+        with torch.inference_mode():
+            pending = []
+            in_flight = None
+            silent_chunks = 0
+            # Batches are assembled in one reusable buffer: every batch has the warm-up width
+            # (the tail is zero-padded and trimmed back when stitching), so the loop does not
+            # allocate a fresh padded copy per chunk. Reuse is safe because the next batch is
+            # copied in on the same stream that runs the previous forward.
+            batch_width = max_chunk_samples if compiled else max(MIN_SEPARATION_SAMPLES, chunk_samples)
+            batch_buffer = torch.empty(batch_size, batch_width, device=device)
+            for index, (start, chunk, offset) in enumerate(loader):
+                # Chunks are still on the host here, so the RMS check costs no device sync;
+                # silent ones skip the model and the gating altogether
+                if chunk.numel() == 0 or chunk.square().mean().sqrt().item() < config.silence_rms:
+                    chunk = None
+                elif copy_stream is not None:
+                    with torch.cuda.stream(copy_stream):
+                        chunk = chunk.to(device, non_blocking=True)
+                else:
+                    chunk = chunk.to(device, non_blocking=True)
+                pending.append((start, chunk, offset))
+                if len(pending) < batch_size and index + 1 < len(dataset):
+                    continue
+
+                # Stitching waits for the previous batch, so it only runs once this batch
+                # has been read and uploaded while the device was still busy with it
+                if in_flight is not None:
+                    stitch(*in_flight)
+                if copy_stream is not None:
+                    torch.cuda.current_stream().wait_stream(copy_stream)
+
+                batch_starts = [chunk_start for chunk_start, _, _ in pending]
+                batch_silent = [pending_chunk is None for _, pending_chunk, _ in pending]
+                chunks = []
+                for chunk_start, pending_chunk, chunk_offset in pending:
+                    if pending_chunk is None:
+                        continue
+                    if copy_stream is not None:
+                        # Keep the caching allocator from reusing the upload before it is consumed
+                        pending_chunk.record_stream(torch.cuda.current_stream())
+                    if resampler is not None:
+                        length = min(chunk_samples, total_samples - chunk_start)
+                        pending_chunk = resampler(pending_chunk)[:, chunk_offset:chunk_offset + length]
+                    chunks.append(pending_chunk)
+                pending = []
+                silent_chunks += batch_silent.count(True)
+                if not chunks:
+                    in_flight = (batch_starts, batch_silent, None)
+                    continue
+
+                # Only the file's tail chunk can be shorter (and sub-second files shorter than 1 s);
+                # it is zero-padded in place. A compiled masknet always gets the full warm-up
+                # shape, padding rows included, so it never recompiles.
+                batch = batch_buffer if compiled else batch_buffer[:len(chunks)]
+                for row, batch_chunk in enumerate(chunks):
+                    batch[row, :batch_chunk.shape[1]].copy_(batch_chunk[0])
+                    batch[row, batch_chunk.shape[1]:].zero_()
+                batch[len(chunks):].zero_()
+                if config.debug_mode:
+                    log_error(f"[SpeechBrain] Separating chunks {batch_starts[0]}:{batch_starts[-1] + chunks[-1].shape[1]}")
+                chunk_lengths = [batch_chunk.shape[1] for batch_chunk in chunks]
+                in_flight = (batch_starts, batch_silent, separate_chunk(batch, chunk_lengths))
+            if in_flight is not None:
+                stitch(*in_flight)
+        log_error(f"[SpeechBrain] Separated {len(dataset) - silent_chunks} chunks, skipped {silent_chunks} silent")
+        if gate_stats:
+            log_error(
+                f"[SpeechBrain] Spectral gating applied to {sum(len(stats) for stats in gate_stats)} chunks: "
+                f"avg_gate={torch.cat(gate_stats).mean().item():.3f}, "
+                f"threshold={config.gate_threshold:.3f}, alpha={config.gate_alpha:.3f}"
+            )
+        if config.debug_mode and torch.device(device).type == "cuda":
+            peak_mb = torch.cuda.max_memory_allocated() / (1024 * 1024)
+            log_error(f"[SpeechBrain] Peak CUDA memory: {peak_mb:.0f} MB")
 
-        source_np = source.squeeze().numpy()
-        sf.write(output_path, source_np, sample_rate)
+        if stream_writer is not None:
+            # Every region is already queued on the stream writer
+            writer, writes = stream_writer, stream_writes
+        else:
+            # output_buffer is [num_speakers, total_samples] by construction
+            sources_tensor = output_buffer
+
+            # Tracks whose peak exceeds full scale are scaled down instead of hard-clipped.
+            # The inf-norm is one fused |x| + max reduction, without an abs() copy of every track.
+            with torch.inference_mode():
+                peaks = torch.linalg.vector_norm(sources_tensor, ord=float("inf"), dim=1, keepdim=True)
+                sources_tensor.div_(peaks.clamp_(min=1.0))
+
+                # SPEECHBRAIN_OUTPUT_SUBTYPE=FLOAT restores 32-bit float WAVs. For the default
+                # PCM_16 all speakers are quantized in one vectorized pass on the device, so
+                # the single device-to-host copy moves half the bytes of float32. Samples are
+                # rounded to nearest: a bare int16 cast truncates toward zero and biases the signal.
+                if config.output_subtype == "PCM_16":
+                    output_sources = sources_tensor.mul_(32767).round_().to(torch.int16).cpu().numpy()
+                else:
+                    output_sources = sources_tensor.cpu().numpy()
+
+            # libsndfile releases the GIL while writing, so speakers are written concurrently
+            writer = ThreadPoolExecutor(max_workers=min(len(output_sources), 4))
+            writes = [
+                writer.submit(sf.write, output_path, source, sample_rate, subtype=config.output_subtype)
+                for output_path, source in zip(output_paths, output_sources)
+            ]
+
+        speakers = []
+        timeline = []
+
+        for speaker_name, output_path in zip(speaker_names, output_paths):
+            speakers.append(
+                {
+                    "name": speaker_name,
+                    "format": "wav",
+                    "local_path": output_path,
+                    "isBackground": False,
+                }
+            )
 
-        speakers.append(
-            {
-                "name": speaker_name,
-                "format": "wav",
-                "local_path": output_path,
-                "isBackground": False,
-            }
-        )
+            timeline.append(
+                {
+                    "speaker": speaker_name,
+                    "start": 0.0,
+                    "end": duration,
+                    "duration": duration,
+                }
+            )
 
-        duration = source.shape[-1] / sample_rate
-        timeline.append(
-            {
-                "speaker": speaker_name,
-                "start": 0.0,
-                "end": round(duration, 2),
-                "duration": round(duration, 2),
-            }
-        )
+        with writer:
+            for write in writes:
+                write.result()  # re-raises any write error
+        completed = True
+    finally:
+        if stream_writer is not None:
+            stream_writer.shutdown(wait=True, cancel_futures=not completed)
+        for stream_file in stream_files:
+            stream_file.close()
+        if not completed:
+            for output_path in output_paths:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
 
     return {
         "success": True,
@@ -285,15 +875,45 @@ def separate(audio_path: str, output_dir: str):
     }
 
 
+def serve():
+    """
+    Persistent worker mode: reads one JSON job per line from stdin
+    ({"audio_path": ..., "output_dir": ...}) and writes one JSON result per
+    line to stdout. The model (and its compiled masknet) is loaded on the
+    first job and reused.
+    """
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+            audio_path = request["audio_path"]
+        except (ValueError, KeyError, TypeError) as exc:
+            result = {"success": False, "error": f"Invalid request: {exc}"}
+        else:
+            if not os.path.isfile(audio_path):
+                result = {"success": False, "error": f"Audio file not found: {audio_path}"}
+            else:
+                try:
+                    result = separate(audio_path, ensure_output_dir(request.get("output_dir")))
+                except Exception as exc:
+                    log_error(f"[SpeechBrain] Error: {exc}")
+                    result = {"success": False, "error": str(exc)}
+        emit_result(result)
+
+
 def main():
+    if sys.argv[1:] == ["--server"]:
+        serve()
+        return
+
     if len(sys.argv) < 3:
-        print(
-            json.dumps(
-                {
-                    "success": False,
-                    "error": "Usage: python speechbrain_separation.py <audio_path> <output_dir>",
-                }
-            )
+        emit_result(
+            {
+                "success": False,
+                "error": "Usage: python speechbrain_separation.py <audio_path> <output_dir> | --server",
+            }
         )
         sys.exit(1)
 
@@ -301,20 +921,16 @@ def main():
     output_dir = ensure_output_dir(sys.argv[2])
 
     if not os.path.isfile(audio_path):
-        print(
-            json.dumps(
-                {"success": False, "error": f"Audio file not found: {audio_path}"}
-            )
-        )
+        emit_result({"success": False, "error": f"Audio file not found: {audio_path}"})
         sys.exit(1)
 
     try:
         result = separate(audio_path, output_dir)
-        print(json.dumps(result))
+        emit_result(result)
         sys.exit(0 if result.get("success") else 1)
     except Exception as exc:
         log_error(f"[SpeechBrain] Error: {exc}")
-        print(json.dumps({"success": False, "error": str(exc)}))
+        emit_result({"success": False, "error": str(exc)})
         sys.exit(1)
 
 
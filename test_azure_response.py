@@ -7,19 +7,20 @@ trying to normalize them to Speechmatics format.
 
 import os
 import sys
-import json
 import logging
 from pathlib import Path
 
 # Add current directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from azure_stt import dumps_pretty
 from dotenv import load_dotenv
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+
 def test_azure_realtime():
     """Test Azure Realtime STT and show raw response structure."""
     try:
@@ -87,12 +88,12 @@ def test_azure_realtime():
     print("\n" + "="*80)
     print("RAW AZURE REALTIME RESPONSE STRUCTURE")
     print("="*80)
-    print(json.dumps(raw_payload, indent=2, ensure_ascii=False))
+    print(dumps_pretty(raw_payload))
     
     print("\n" + "="*80)
     print("NORMALIZED SEGMENTS (current format)")
     print("="*80)
-    print(json.dumps(segments[:5] if len(segments) > 5 else segments, indent=2, ensure_ascii=False))
+    print(dumps_pretty(segments[:5]))
     if len(segments) > 5:
         print(f"\n... and {len(segments) - 5} more segments")
     
@@ -149,12 +150,12 @@ def test_azure_batch():
     print("\n" + "="*80)
     print("RAW AZURE BATCH RESPONSE STRUCTURE")
     print("="*80)
-    print(json.dumps(azure_payload, indent=2, ensure_ascii=False))
+    print(dumps_pretty(azure_payload))
     
     print("\n" + "="*80)
     print("NORMALIZED SEGMENTS (current format)")
     print("="*80)
-    print(json.dumps(segments[:5] if len(segments) > 5 else segments, indent=2, ensure_ascii=False))
+    print(dumps_pretty(segments[:5]))
     if len(segments) > 5:
         print(f"\n... and {len(segments) - 5} more segments")
     
@@ -195,6 +196,6 @@ if __name__ == '__main__':
     if args.output and results:
         output_file = Path(args.output)
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+            f.write(dumps_pretty(results))
         print(f"\n✅ Results saved to: {output_file}")
 
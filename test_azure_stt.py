@@ -5,15 +5,16 @@ Quick validation helpers for the Azure Speech-to-Text client.
 Usage:
     python test_azure_stt.py               # Parse built-in sample JSON
     python test_azure_stt.py --live-url https://.../audio.wav --language en-US
+    python test_azure_stt.py --bench-parse   # Validate and time duration parsing
 """
 
 import argparse
-import json
 import os
 import sys
+import time
 from typing import Any, Dict
 
-from azure_stt import AzureSpeechClient
+from azure_stt import AzureSpeechClient, dumps_pretty
 
 
 def run_sample() -> None:
@@ -69,7 +70,23 @@ def run_sample() -> None:
     client = AzureSpeechClient(subscription_key="test-key", region="eastus")
     segments = client.parse_response_to_segments(sample_payload)
     print(f"Parsed {len(segments)} segments from sample payload:")
-    print(json.dumps(segments, indent=2))
+    print(dumps_pretty(segments))
+
+
+def run_parse_benchmark(iterations: int = 1_000_000) -> None:
+    """Check and time AzureSpeechClient._parse_iso_duration on typical Azure values."""
+    parse = AzureSpeechClient._parse_iso_duration
+    cases = {"PT0.76S": 0.76, "PT12S": 12.0, "PT1M2.5S": 62.5, "PT1H0M3S": 3603.0, "PT0S": 0.0, "": 0.0}
+    # Not valid ISO durations: float() would accept the seconds part, the pattern does not
+    cases.update({"PTinfS": 0.0, "PTnanS": 0.0, "PT-1S": 0.0, "PT1e3S": 0.0})
+    for value, expected in cases.items():
+        assert abs(parse(value) - expected) < 1e-9, f"{value!r} parsed as {parse(value)}, expected {expected}"
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parse("PT0.76S")
+    elapsed = time.perf_counter() - start
+    print(f"Parsed {iterations} durations in {elapsed:.2f}s ({elapsed / iterations * 1e9:.0f} ns each)")
 
 
 def run_live(audio_url: str, language: str) -> None:
@@ -91,17 +108,20 @@ def run_live(audio_url: str, language: str) -> None:
         max_speakers=4,
     )
     print(f"Live transcription returned {len(segments)} segments.")
-    print(json.dumps(segments[:5], indent=2))
+    print(dumps_pretty(segments[:5]))
 
 
 def main():
     parser = argparse.ArgumentParser(description="Azure STT client quick validation")
     parser.add_argument("--live-url", help="Audio URL to submit to Azure STT (requires Azure credentials)")
     parser.add_argument("--language", default="en-US", help="Locale for live submissions (default: en-US)")
+    parser.add_argument("--bench-parse", action="store_true", help="Validate and time ISO-8601 duration parsing")
     args = parser.parse_args()
 
     if args.live_url:
         run_live(args.live_url, args.language)
+    elif args.bench_parse:
+        run_parse_benchmark()
     else:
         run_sample()
 
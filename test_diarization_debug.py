@@ -5,6 +5,8 @@
 import os
 import sys
 import json
+from functools import lru_cache
+import numpy as np
 
 # Додаємо поточну директорію до шляху
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -16,6 +18,44 @@ from app_ios_shortcuts import (
     transcribe_audio,
     combine_diarization_and_transcription
 )
+from speaker_stats import aggregate_by_speaker
+
+
+@lru_cache(maxsize=8)
+def _resampler(source_rate, target_rate):
+    """Resample з уже побудованим ядром фільтра, один на пару частот"""
+    import torchaudio
+    return torchaudio.transforms.Resample(source_rate, target_rate)
+
+
+def _load_waveform_16k(audio_path):
+    """
+    Завантажує аудіо один раз як моно float32 з частотою 16 кГц.
+    
+    Returns:
+        (waveform [1, samples], 16000) - той самий тензор іде в PyAnnote (in-memory dict)
+        і в extract_speaker_embeddings, тож файл не декодується повторно
+    """
+    import torch
+    import torchaudio
+    import soundfile as sf
+    
+    try:
+        data, sample_rate = sf.read(audio_path, dtype='float32')
+        # Downmix у numpy до конвертації в torch
+        if data.ndim > 1:
+            data = data.mean(axis=1, dtype=np.float32)
+        waveform = torch.from_numpy(data).unsqueeze(0)
+    except Exception as load_error:
+        print(f"⚠️  soundfile failed: {load_error}, trying torchaudio...")
+        waveform, sample_rate = torchaudio.load(audio_path)
+        if waveform.shape[0] > 1:
+            waveform = torch.mean(waveform, dim=0, keepdim=True)
+    
+    if sample_rate != 16000:
+        waveform = _resampler(sample_rate, 16000)(waveform.contiguous())
+    return waveform, 16000
+
 
 def test_diarization(audio_path):
     """Тестує діаризацію на заданому файлі"""
@@ -26,15 +66,18 @@ def test_diarization(audio_path):
         print(f"❌ File not found: {audio_path}")
         return
     
+    # Аудіо декодується один раз у Тесті 1; якщо це не вдалося, Тест 2 читає файл сам
+    waveform = None
+    
     # Тест 1: PyAnnote діаризація
     print("\n📊 TEST 1: PyAnnote Diarization")
     print("-" * 80)
     try:
+        waveform, sample_rate = _load_waveform_16k(audio_path)
+        
         import pyannote_patch  # noqa: F401
         from pyannote.audio import Pipeline
         import torch
-        import torchaudio
-        import soundfile as sf
         
         hf_token = os.getenv('HUGGINGFACE_TOKEN')
         if not hf_token:
@@ -43,62 +86,68 @@ def test_diarization(audio_path):
             device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
             print(f"📦 Loading PyAnnote pipeline on {device}...")
             
-            pipeline = Pipeline.from_pretrained(
-                "pyannote/speaker-diarization-3.1",
-                use_auth_token=hf_token
-            )
+            # DIARIZATION_PIPELINE_CACHE=<шлях>: пайплайн зберігається через torch.save після
+            # першого завантаження, і наступні запуски скрипта читають його звідти.
+            # Файл розпаковується через pickle (weights_only=False), тобто може виконати
+            # довільний код - вказуйте лише власний довірений файл. Версії pyannote і torch
+            # входять в ім'я файлу: після оновлення пакетів старий pickle не читається
+            pipeline_cache = os.getenv('DIARIZATION_PIPELINE_CACHE')
+            if pipeline_cache:
+                import pyannote.audio
+                cache_root, cache_ext = os.path.splitext(pipeline_cache)
+                pipeline_cache = (
+                    f"{cache_root}-pyannote{pyannote.audio.__version__}"
+                    f"-torch{torch.__version__}{cache_ext or '.pt'}"
+                )
+            pipeline = None
+            if pipeline_cache and os.path.exists(pipeline_cache):
+                try:
+                    pipeline = torch.load(pipeline_cache, map_location="cpu", weights_only=False)
+                    print(f"📂 Loaded cached pipeline: {pipeline_cache}")
+                except Exception as cache_error:
+                    print(f"⚠️  Cached pipeline unusable ({cache_error}), loading from HuggingFace...")
+            if pipeline is None:
+                pipeline = Pipeline.from_pretrained(
+                    "pyannote/speaker-diarization-3.1",
+                    use_auth_token=hf_token
+                )
+                if pipeline_cache:
+                    try:
+                        torch.save(pipeline, pipeline_cache)
+                        print(f"💾 Cached pipeline to: {pipeline_cache}")
+                    except Exception as cache_error:
+                        # Кеш лише прискорює наступні запуски; без нього тест працює як раніше
+                        print(f"⚠️  Could not cache pipeline ({cache_error}), continuing without cache")
             pipeline.to(device)
             
-            # Завантажуємо аудіо
-            try:
-                data, sample_rate = sf.read(audio_path, dtype='float32')
-                if len(data.shape) == 1:
-                    waveform = torch.from_numpy(data).unsqueeze(0).float()
-                else:
-                    waveform = torch.from_numpy(data).transpose(0, 1).float()
-            except Exception as load_error:
-                print(f"⚠️  soundfile failed: {load_error}, trying torchaudio...")
-                waveform, sample_rate = torchaudio.load(audio_path)
-            
-            # Конвертуємо в mono
-            if waveform.shape[0] > 1:
-                waveform = torch.mean(waveform, dim=0, keepdim=True)
-            
-            # Resample до 16kHz
-            if sample_rate != 16000:
-                resampler = torchaudio.transforms.Resample(sample_rate, 16000)
-                waveform = resampler(waveform)
-                sample_rate = 16000
-            
-            # Запускаємо діаризацію
+            # Запускаємо діаризацію (аудіо вже в пам'яті, PyAnnote не читає файл)
             print("🎯 Running PyAnnote diarization...")
             diarization = pipeline({
                 "waveform": waveform,
                 "sample_rate": sample_rate
             })
             
-            # Конвертуємо результат
-            diarization_segments = []
+            # Конвертуємо результат за один прохід у три паралельні масиви (SoA);
+            # спікери нумеруються в порядку першої появи
             speaker_map = {}
-            next_speaker_id = 0
-            
-            # Збираємо всі унікальні спікерів
-            for turn, _, speaker in diarization.itertracks(yield_label=True):
-                if speaker not in speaker_map:
-                    speaker_map[speaker] = next_speaker_id
-                    next_speaker_id += 1
-            
-            # Створюємо сегменти
+            turn_starts, turn_ends, turn_speakers = [], [], []
             for turn, _, speaker in diarization.itertracks(yield_label=True):
-                speaker_id = speaker_map[speaker]
-                diarization_segments.append({
-                    'speaker': speaker_id,
-                    'start': round(turn.start, 2),
-                    'end': round(turn.end, 2)
-                })
+                turn_starts.append(turn.start)
+                turn_ends.append(turn.end)
+                turn_speakers.append(speaker_map.setdefault(speaker, len(speaker_map)))
             
             # Сортуємо за часом
-            diarization_segments.sort(key=lambda x: x['start'])
+            starts = np.round(np.asarray(turn_starts, dtype=np.float64), 2)
+            ends = np.round(np.asarray(turn_ends, dtype=np.float64), 2)
+            speakers = np.asarray(turn_speakers, dtype=np.int64)
+            order = np.argsort(starts, kind='stable')
+            starts, ends, speakers = starts[order], ends[order], speakers[order]
+            
+            # Словники потрібні лише для виводу та combine_diarization_and_transcription
+            diarization_segments = [
+                {'speaker': speaker, 'start': start, 'end': end}
+                for speaker, start, end in zip(speakers.tolist(), starts.tolist(), ends.tolist())
+            ]
             
             print(f"✅ PyAnnote found {len(diarization_segments)} segments from {len(speaker_map)} speakers")
             print(f"   Speaker mapping: {speaker_map}")
@@ -107,13 +156,7 @@ def test_diarization(audio_path):
                 print(f"   [{seg['start']:.2f}s - {seg['end']:.2f}s] Speaker {seg['speaker']}")
             
             # Підраховуємо тривалість для кожного спікера
-            speaker_durations = {}
-            for seg in diarization_segments:
-                speaker = seg['speaker']
-                duration = seg['end'] - seg['start']
-                if speaker not in speaker_durations:
-                    speaker_durations[speaker] = 0
-                speaker_durations[speaker] += duration
+            speaker_durations = aggregate_by_speaker(speakers, ends - starts)
             
             print(f"\n📊 Speaker durations:")
             for speaker, dur in sorted(speaker_durations.items()):
@@ -132,7 +175,8 @@ def test_diarization(audio_path):
         embeddings, timestamps = extract_speaker_embeddings(
             audio_path,
             segment_duration=1.5,
-            overlap=0.5
+            overlap=0.5,
+            audio=waveform[0].numpy() if waveform is not None else None
         )
         
         if embeddings is None or len(embeddings) == 0:
@@ -153,13 +197,10 @@ def test_diarization(audio_path):
                     print(f"   [{seg['start']:.2f}s - {seg['end']:.2f}s] Speaker {seg['speaker']}")
                 
                 # Підраховуємо тривалість для кожного спікера
-                speaker_durations_sb = {}
-                for seg in diarization_segments_sb:
-                    speaker = seg['speaker']
-                    duration = seg['end'] - seg['start']
-                    if speaker not in speaker_durations_sb:
-                        speaker_durations_sb[speaker] = 0
-                    speaker_durations_sb[speaker] += duration
+                speaker_durations_sb = aggregate_by_speaker(
+                    [seg['speaker'] for seg in diarization_segments_sb],
+                    np.fromiter((seg['end'] - seg['start'] for seg in diarization_segments_sb), dtype=np.float64),
+                )
                 
                 print(f"\n📊 Speaker durations:")
                 for speaker, dur in sorted(speaker_durations_sb.items()):
@@ -196,13 +237,10 @@ def test_diarization(audio_path):
                     print(f"   [{seg['start']:.2f}s - {seg['end']:.2f}s] Speaker {seg['speaker']}: {seg['text'][:50]}")
                 
                 # Підраховуємо слова по спікерах
-                speaker_word_counts = {}
-                for seg in combined:
-                    speaker = seg['speaker']
-                    word_count = len(seg['text'].split())
-                    if speaker not in speaker_word_counts:
-                        speaker_word_counts[speaker] = 0
-                    speaker_word_counts[speaker] += word_count
+                speaker_word_counts = aggregate_by_speaker(
+                    [seg['speaker'] for seg in combined],
+                    np.fromiter((len(seg['text'].split()) for seg in combined), dtype=np.int64),
+                )
                 
                 print(f"\n📊 Word distribution by speaker:")
                 for speaker, count in sorted(speaker_word_counts.items()):
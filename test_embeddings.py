@@ -9,6 +9,7 @@ import numpy as np
 import torch
 import traceback
 import tempfile
+import time
 import soundfile as sf
 
 # Патч для torchaudio сумісності з speechbrain
@@ -16,6 +17,11 @@ exec(open('patch_torchaudio.py').read())
 
 from speechbrain.pretrained import SpeakerRecognition
 
+
+def _is_clean(x):
+    """True, якщо в масиві немає NaN/Inf (один прохід замість isnan + isinf)"""
+    return np.isfinite(x).all()
+
 print("="*60)
 print("🧪 TEST: SpeechBrain Embedding Extraction")
 print("="*60)
@@ -23,9 +29,16 @@ print("="*60)
 # Завантаження моделі
 print("\n🔄 Loading SpeechBrain model...")
 try:
+    # Як і load_models() в app_ios_shortcuts.py: локальна копія завантажується без звернень до HuggingFace
+    model_path = "pretrained_models/spkrec-ecapa-voxceleb"
+    if os.path.exists(os.path.join(model_path, "hyperparams.yaml")):
+        print(f"📂 Loading from local directory: {model_path}")
+        model_source = model_path
+    else:
+        model_source = "speechbrain/spkrec-ecapa-voxceleb"
     speaker_model = SpeakerRecognition.from_hparams(
-        source="speechbrain/spkrec-ecapa-voxceleb",
-        savedir="pretrained_models/spkrec-ecapa-voxceleb"
+        source=model_source,
+        savedir=model_path
     )
     print("✅ Model loaded successfully!")
 except Exception as e:
@@ -45,7 +58,12 @@ except:
 print("\n🎵 Creating test audio segment (2 seconds, 16kHz)...")
 sr = 16000
 duration = 2.0
-test_audio = np.random.randn(int(sr * duration)).astype(np.float32)
+# Детермінований float32 шум без проміжного float64 масиву; тензори - view на той самий буфер
+_RNG = np.random.default_rng(0)
+test_audio = _RNG.standard_normal(int(sr * duration), dtype=np.float32)
+_SEGMENT_TENSOR_1D = torch.from_numpy(test_audio)
+_SEGMENT_TENSOR_2D = _SEGMENT_TENSOR_1D.unsqueeze(0)  # [1, samples]
+_SEGMENT_TENSOR_3D = _SEGMENT_TENSOR_2D.unsqueeze(0)  # [1, 1, samples]
 print(f"✅ Test audio created: shape={test_audio.shape}, dtype={test_audio.dtype}, samples={len(test_audio)}")
 
 # Тест 1: encode_batch з normalize=False, формат [1, 1, samples]
@@ -53,7 +71,7 @@ print("\n" + "-"*60)
 print("TEST 1: encode_batch(tensor [1,1,samples], normalize=False)")
 print("-"*60)
 try:
-    segment_tensor = torch.tensor(test_audio, dtype=torch.float32).unsqueeze(0).unsqueeze(0)
+    segment_tensor = _SEGMENT_TENSOR_3D
     print(f"📊 Tensor shape: {segment_tensor.shape}, dtype: {segment_tensor.dtype}, device: {segment_tensor.device}")
     
     embedding = speaker_model.encode_batch(segment_tensor, normalize=False)
@@ -61,7 +79,7 @@ try:
     
     print(f"✅ SUCCESS! Embedding shape: {embedding.shape}, dtype: {embedding.dtype}")
     print(f"📊 Embedding stats: min={embedding.min():.4f}, max={embedding.max():.4f}, mean={embedding.mean():.4f}")
-    if np.any(np.isnan(embedding)) or np.any(np.isinf(embedding)):
+    if not _is_clean(embedding):
         print("⚠️  WARNING: NaN or Inf found in embedding!")
     else:
         print("✅ No NaN or Inf in embedding")
@@ -74,7 +92,7 @@ print("\n" + "-"*60)
 print("TEST 2: encode_batch(tensor [1,1,samples]) - без normalize")
 print("-"*60)
 try:
-    segment_tensor = torch.tensor(test_audio, dtype=torch.float32).unsqueeze(0).unsqueeze(0)
+    segment_tensor = _SEGMENT_TENSOR_3D
     print(f"📊 Tensor shape: {segment_tensor.shape}, dtype: {segment_tensor.dtype}, device: {segment_tensor.device}")
     
     embedding = speaker_model.encode_batch(segment_tensor)
@@ -82,7 +100,7 @@ try:
     
     print(f"✅ SUCCESS! Embedding shape: {embedding.shape}, dtype: {embedding.dtype}")
     print(f"📊 Embedding stats: min={embedding.min():.4f}, max={embedding.max():.4f}, mean={embedding.mean():.4f}")
-    if np.any(np.isnan(embedding)) or np.any(np.isinf(embedding)):
+    if not _is_clean(embedding):
         print("⚠️  WARNING: NaN or Inf found in embedding!")
     else:
         print("✅ No NaN or Inf in embedding")
@@ -95,7 +113,7 @@ print("\n" + "-"*60)
 print("TEST 3: encode_batch(tensor [1,samples]) - без подвійного unsqueeze")
 print("-"*60)
 try:
-    segment_tensor = torch.tensor(test_audio, dtype=torch.float32).unsqueeze(0)
+    segment_tensor = _SEGMENT_TENSOR_2D
     print(f"📊 Tensor shape: {segment_tensor.shape}, dtype: {segment_tensor.dtype}, device: {segment_tensor.device}")
     
     embedding = speaker_model.encode_batch(segment_tensor)
@@ -103,7 +121,7 @@ try:
     
     print(f"✅ SUCCESS! Embedding shape: {embedding.shape}, dtype: {embedding.dtype}")
     print(f"📊 Embedding stats: min={embedding.min():.4f}, max={embedding.max():.4f}, mean={embedding.mean():.4f}")
-    if np.any(np.isnan(embedding)) or np.any(np.isinf(embedding)):
+    if not _is_clean(embedding):
         print("⚠️  WARNING: NaN or Inf found in embedding!")
     else:
         print("✅ No NaN or Inf in embedding")
@@ -128,7 +146,7 @@ if hasattr(speaker_model, 'encode_file'):
         
         print(f"✅ SUCCESS! Embedding shape: {embedding.shape}, dtype: {embedding.dtype}")
         print(f"📊 Embedding stats: min={embedding.min():.4f}, max={embedding.max():.4f}, mean={embedding.mean():.4f}")
-        if np.any(np.isnan(embedding)) or np.any(np.isinf(embedding)):
+        if not _is_clean(embedding):
             print("⚠️  WARNING: NaN or Inf found in embedding!")
         else:
             print("✅ No NaN or Inf in embedding")
@@ -152,7 +170,7 @@ print("TEST 5: Direct access via mods.encoder() + mods.embedding_model()")
 print("-"*60)
 if hasattr(speaker_model, 'mods') and hasattr(speaker_model.mods, 'encoder'):
     try:
-        segment_tensor = torch.tensor(test_audio, dtype=torch.float32).unsqueeze(0)
+        segment_tensor = _SEGMENT_TENSOR_2D
         wav_lens = torch.tensor([len(test_audio) / sr], dtype=torch.float32)
         
         print(f"📊 Tensor shape: {segment_tensor.shape}, dtype: {segment_tensor.dtype}, device: {segment_tensor.device}")
@@ -171,7 +189,7 @@ if hasattr(speaker_model, 'mods') and hasattr(speaker_model.mods, 'encoder'):
         
         print(f"✅ SUCCESS! Embedding shape: {embedding.shape}, dtype: {embedding.dtype}")
         print(f"📊 Embedding stats: min={embedding.min():.4f}, max={embedding.max():.4f}, mean={embedding.mean():.4f}")
-        if np.any(np.isnan(embedding)) or np.any(np.isinf(embedding)):
+        if not _is_clean(embedding):
             print("⚠️  WARNING: NaN or Inf found in embedding!")
         else:
             print("✅ No NaN or Inf in embedding")
@@ -187,7 +205,7 @@ print("TEST 6: Direct access via mods.encoder() only (no embedding_model)")
 print("-"*60)
 if hasattr(speaker_model, 'mods') and hasattr(speaker_model.mods, 'encoder'):
     try:
-        segment_tensor = torch.tensor(test_audio, dtype=torch.float32).unsqueeze(0)
+        segment_tensor = _SEGMENT_TENSOR_2D
         wav_lens = torch.tensor([len(test_audio) / sr], dtype=torch.float32)
         
         print(f"📊 Tensor shape: {segment_tensor.shape}, dtype: {segment_tensor.dtype}, device: {segment_tensor.device}")
@@ -198,7 +216,7 @@ if hasattr(speaker_model, 'mods') and hasattr(speaker_model.mods, 'encoder'):
         
         print(f"✅ SUCCESS! Embedding shape: {embedding.shape}, dtype: {embedding.dtype}")
         print(f"📊 Embedding stats: min={embedding.min():.4f}, max={embedding.max():.4f}, mean={embedding.mean():.4f}")
-        if np.any(np.isnan(embedding)) or np.any(np.isinf(embedding)):
+        if not _is_clean(embedding):
             print("⚠️  WARNING: NaN or Inf found in embedding!")
         else:
             print("✅ No NaN or Inf in embedding")
@@ -213,7 +231,7 @@ print("\n" + "-"*60)
 print("TEST 7: encode_batch with tensor on model device")
 print("-"*60)
 try:
-    segment_tensor = torch.tensor(test_audio, dtype=torch.float32).unsqueeze(0).unsqueeze(0).to(device)
+    segment_tensor = _SEGMENT_TENSOR_3D.to(device)
     print(f"📊 Tensor shape: {segment_tensor.shape}, dtype: {segment_tensor.dtype}, device: {segment_tensor.device}")
     
     embedding = speaker_model.encode_batch(segment_tensor, normalize=False)
@@ -221,7 +239,59 @@ try:
     
     print(f"✅ SUCCESS! Embedding shape: {embedding.shape}, dtype: {embedding.dtype}")
     print(f"📊 Embedding stats: min={embedding.min():.4f}, max={embedding.max():.4f}, mean={embedding.mean():.4f}")
-    if np.any(np.isnan(embedding)) or np.any(np.isinf(embedding)):
+    if not _is_clean(embedding):
+        print("⚠️  WARNING: NaN or Inf found in embedding!")
+    else:
+        print("✅ No NaN or Inf in embedding")
+except Exception as e:
+    print(f"❌ FAILED: {e}")
+    traceback.print_exc()
+
+# Тест 8: батчеве кодування [N, samples] одним викликом encode_batch
+print("\n" + "-"*60)
+print("TEST 8: encode_batch(tensor [N,samples]) - batched throughput")
+print("-"*60)
+try:
+    for batch_size in (1, 8, 32, 128):
+        segment_tensor = torch.from_numpy(np.tile(test_audio, (batch_size, 1))).to(device)
+        wav_lens = torch.ones(batch_size, device=device)
+        
+        start_time = time.perf_counter()
+        with torch.no_grad():
+            embedding = speaker_model.encode_batch(segment_tensor, wav_lens=wav_lens, normalize=False)
+        embedding = embedding.squeeze(1).cpu().numpy()
+        elapsed = time.perf_counter() - start_time
+        
+        print(f"✅ N={batch_size}: embeddings shape={embedding.shape}, {elapsed:.3f}s, {batch_size / elapsed:.1f} segments/s")
+        if not _is_clean(embedding):
+            bad_rows = np.flatnonzero(~np.isfinite(embedding).all(axis=1))
+            print(f"⚠️  WARNING: NaN or Inf found in embedding rows {bad_rows.tolist()}!")
+except Exception as e:
+    print(f"❌ FAILED: {e}")
+    traceback.print_exc()
+
+# Тест 9: батчеве кодування під autocast (fp16 на CUDA, bf16 на CPU)
+print("\n" + "-"*60)
+print("TEST 9: encode_batch(tensor [N,samples]) under torch.autocast")
+print("-"*60)
+try:
+    autocast_dtype = torch.float16 if device.type == 'cuda' else torch.bfloat16
+    segment_tensor = torch.from_numpy(np.tile(test_audio, (8, 1))).to(device)
+    print(f"📊 Tensor shape: {segment_tensor.shape}, autocast dtype: {autocast_dtype}, device: {device}")
+    
+    with torch.no_grad():
+        reference = speaker_model.encode_batch(segment_tensor, normalize=False).squeeze(1)
+        start_time = time.perf_counter()
+        with torch.autocast(device_type=device.type, dtype=autocast_dtype):
+            embedding = speaker_model.encode_batch(segment_tensor, normalize=False).squeeze(1)
+        elapsed = time.perf_counter() - start_time
+    
+    cosine = torch.nn.functional.cosine_similarity(embedding.float(), reference.float(), dim=1).min().item()
+    embedding = embedding.float().cpu().numpy()
+    
+    print(f"✅ SUCCESS! Embedding shape: {embedding.shape}, dtype: {embedding.dtype}, {elapsed:.3f}s")
+    print(f"📊 Min cosine similarity to fp32: {cosine:.5f}")
+    if not _is_clean(embedding):
         print("⚠️  WARNING: NaN or Inf found in embedding!")
     else:
         print("✅ No NaN or Inf in embedding")
@@ -229,6 +299,64 @@ except Exception as e:
     print(f"❌ FAILED: {e}")
     traceback.print_exc()
 
+# Тест 10: вікна через unfold на пристрої, один батч проти кодування по одному сегменту
+print("\n" + "-"*60)
+print("TEST 10: unfold windows on device - batched vs per-segment")
+print("-"*60)
+try:
+    segment_samples = 24000  # 1.5 с
+    stride_samples = 12000   # перекриття 0.5
+    long_audio = _RNG.standard_normal(16000 * 6, dtype=np.float32) * 0.1
+    waveform = torch.from_numpy(long_audio).to(device)
+    windows = waveform.unfold(0, segment_samples, stride_samples)  # [N, segment_samples]
+    print(f"📊 Windows shape: {tuple(windows.shape)}, device: {windows.device}")
+    
+    with torch.no_grad():
+        batched = speaker_model.encode_batch(
+            windows.contiguous(), wav_lens=torch.ones(windows.shape[0], device=device), normalize=False
+        ).squeeze(1)
+        per_segment = torch.cat([
+            speaker_model.encode_batch(window.unsqueeze(0), normalize=False).squeeze(1)
+            for window in windows
+        ])
+    
+    max_distance = (1 - torch.nn.functional.cosine_similarity(batched, per_segment, dim=1)).max().item()
+    print(f"📊 Max cosine distance batched vs per-segment: {max_distance:.2e}")
+    if max_distance < 1e-4:
+        print("✅ Batched embeddings match per-segment embeddings")
+    else:
+        print("⚠️  WARNING: batched embeddings differ from per-segment embeddings!")
+except Exception as e:
+    print(f"❌ FAILED: {e}")
+    traceback.print_exc()
+
+# Тест 11: int8 квантизація ембедингів (max-abs масштаб на рядок) перед кластеризацією
+print("\n" + "-"*60)
+print("TEST 11: int8-quantized embeddings - cosine distance delta")
+print("-"*60)
+try:
+    long_audio = _RNG.standard_normal(16000 * 6, dtype=np.float32) * 0.1
+    windows = torch.from_numpy(long_audio).unfold(0, 24000, 12000).to(device)
+    with torch.no_grad():
+        embedding = speaker_model.encode_batch(windows.contiguous(), normalize=False).squeeze(1).float().cpu().numpy()
+    
+    # Той самий шлях, що й у diarize_audio: L2-нормалізація, квантизація, матриця відстаней
+    from embedding_distances import quantize_embeddings_int8, pairwise_cosine_int8, pairwise_cosine
+    normalized = embedding / np.linalg.norm(embedding, axis=1, keepdims=True)
+    quantized, scale = quantize_embeddings_int8(normalized)
+    
+    delta = np.abs(pairwise_cosine_int8(quantized) - pairwise_cosine(normalized)).max()
+    print(f"📊 Quantized shape: {quantized.shape}, dtype: {quantized.dtype}, bytes: {quantized.nbytes} vs {embedding.nbytes}")
+    print(f"📊 Max cosine distance delta int8 vs fp32: {delta:.2e}")
+    # Крок квантизації max|x|/127 дає для 192-вимірних одиничних векторів похибку відстані ~2e-3
+    if delta < 5e-3:
+        print("✅ int8 embeddings preserve cosine distances")
+    else:
+        print(f"❌ FAILED: int8 quantization changes cosine distances by {delta:.2e} (> 5e-3)")
+except Exception as e:
+    print(f"❌ FAILED: {e}")
+    traceback.print_exc()
+
 print("\n" + "="*60)
 print("🏁 TESTING COMPLETE")
 print("="*60)
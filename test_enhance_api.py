@@ -2,11 +2,65 @@
 """
 Тест через API для перевірки роботи enhance-main-speaker
 """
-import requests
+import argparse
+import http.client
+import io
 import os
 import json
+import uuid
+from urllib.parse import urlsplit
 
-def test_enhance_api(audio_path):
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class MultipartStream:
+    """
+    Тіло multipart/form-data, яке читається частинами: аудіофайл відправляється
+    прямо з диска і не завантажується в пам'ять цілком.
+    """
+    
+    def __init__(self, fields, file_field, file_path, content_type='audio/wav'):
+        boundary = uuid.uuid4().hex
+        head = ''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        )
+        head += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+            f'filename="{os.path.basename(file_path)}"\r\nContent-Type: {content_type}\r\n\r\n'
+        )
+        tail = f'\r\n--{boundary}--\r\n'.encode()
+        head = head.encode()
+        self._file = open(file_path, 'rb')
+        self._parts = [io.BytesIO(head), self._file, io.BytesIO(tail)]
+        # Розмір відомий заздалегідь, тому запит іде з Content-Length, а не chunked
+        self.len = len(head) + os.path.getsize(file_path) + len(tail)
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+    
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and size != 0:
+            data = self._parts[0].read(size)
+            if not data:
+                self._parts.pop(0)
+                continue
+            chunks.append(data)
+            if size > 0:
+                size -= len(data)
+        return b''.join(chunks)
+    
+    def close(self):
+        self._file.close()
+
+
+DEFAULT_URL = "http://localhost:5005/api/enhance-main-speaker"
+DEFAULT_FILE = "audio examples/detecting main speakers/speaker_0.wav"
+
+
+def test_enhance_api(audio_path, url=DEFAULT_URL):
     """Тестує API enhance-main-speaker"""
     print(f"🔍 Testing API: /api/enhance-main-speaker")
     print(f"   File: {audio_path}")
@@ -16,64 +70,77 @@ def test_enhance_api(audio_path):
         print(f"❌ File not found: {audio_path}")
         return
     
-    url = "http://localhost:5005/api/enhance-main-speaker"
-    
-    with open(audio_path, 'rb') as f:
-        files = {'file': (os.path.basename(audio_path), f, 'audio/wav')}
-        data = {
-            'suppression_factor': '0.0',
-            'num_speakers': '2',
-            'return_json': 'true'
-        }
-        
+    data = {
+        'suppression_factor': '0.0',
+        'num_speakers': '2',
+        'return_json': 'true'
+    }
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    connection = connection_class(parts.netloc)
+    target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+    body = MultipartStream(data, 'file', audio_path)
+    try:
         print("📤 Sending request...")
-        response = requests.post(url, files=files, data=data)
+        # http.client читає тіло блоками через body.read(), файл не завантажується в пам'ять
+        connection.request('POST', target, body=body, headers={
+            'Content-Type': body.content_type,
+            'Content-Length': str(body.len),
+        })
+        response = connection.getresponse()
+        content = response.read()
+    finally:
+        body.close()
+        connection.close()
+    
+    if response.status == 200:
+        result = orjson.loads(content) if orjson is not None else json.loads(content)
         
-        if response.status_code == 200:
-            result = response.json()
+        if result.get('success'):
+            print(f"✅ Success!")
+            print(f"   Main speaker: {result.get('main_speaker')}")
+            print(f"   Total segments: {result.get('segments_info', {}).get('total_segments', 0)}")
+            
+            transcription_segments = result.get('segments_info', {}).get('transcription_segments', [])
+            speakers_in_transcription = set(seg.get('speaker') for seg in transcription_segments)
+            
+            print(f"\n📊 Speakers in transcription: {sorted(speakers_in_transcription)}")
+            
+            # Підраховуємо слова по спікерах
+            speaker_word_counts = {}
+            for seg in transcription_segments:
+                speaker = seg.get('speaker')
+                word_count = len(seg.get('text', '').split())
+                if speaker not in speaker_word_counts:
+                    speaker_word_counts[speaker] = 0
+                speaker_word_counts[speaker] += word_count
+            
+            print(f"\n📊 Word distribution by speaker:")
+            for speaker, count in sorted(speaker_word_counts.items()):
+                marker = " 👑" if speaker == result.get('main_speaker') else ""
+                print(f"   Speaker {speaker}: {count} words{marker}")
+            
+            print(f"\n📝 First 10 transcription segments:")
+            for i, seg in enumerate(transcription_segments[:10]):
+                is_main = seg.get('speaker') == result.get('main_speaker')
+                marker = " [MAIN]" if is_main else " [OTHER]"
+                print(f"   {i+1}. [{seg.get('start', 0):.2f}s - {seg.get('end', 0):.2f}s] Speaker {seg.get('speaker')}{marker}: {seg.get('text', '')[:60]}")
             
-            if result.get('success'):
-                print(f"✅ Success!")
-                print(f"   Main speaker: {result.get('main_speaker')}")
-                print(f"   Total segments: {result.get('segments_info', {}).get('total_segments', 0)}")
-                
-                transcription_segments = result.get('segments_info', {}).get('transcription_segments', [])
-                speakers_in_transcription = set(seg.get('speaker') for seg in transcription_segments)
-                
-                print(f"\n📊 Speakers in transcription: {sorted(speakers_in_transcription)}")
-                
-                # Підраховуємо слова по спікерах
-                speaker_word_counts = {}
-                for seg in transcription_segments:
-                    speaker = seg.get('speaker')
-                    word_count = len(seg.get('text', '').split())
-                    if speaker not in speaker_word_counts:
-                        speaker_word_counts[speaker] = 0
-                    speaker_word_counts[speaker] += word_count
-                
-                print(f"\n📊 Word distribution by speaker:")
-                for speaker, count in sorted(speaker_word_counts.items()):
-                    marker = " 👑" if speaker == result.get('main_speaker') else ""
-                    print(f"   Speaker {speaker}: {count} words{marker}")
-                
-                print(f"\n📝 First 10 transcription segments:")
-                for i, seg in enumerate(transcription_segments[:10]):
-                    is_main = seg.get('speaker') == result.get('main_speaker')
-                    marker = " [MAIN]" if is_main else " [OTHER]"
-                    print(f"   {i+1}. [{seg.get('start', 0):.2f}s - {seg.get('end', 0):.2f}s] Speaker {seg.get('speaker')}{marker}: {seg.get('text', '')[:60]}")
-                
-                # Перевірка
-                if 1 in speakers_in_transcription:
-                    print(f"\n✅ SUCCESS: Speaker 1 is present in transcription!")
-                else:
-                    print(f"\n❌ PROBLEM: Speaker 1 is NOT present in transcription!")
+            # Перевірка
+            if 1 in speakers_in_transcription:
+                print(f"\n✅ SUCCESS: Speaker 1 is present in transcription!")
             else:
-                print(f"❌ Error: {result.get('error', 'Unknown error')}")
+                print(f"\n❌ PROBLEM: Speaker 1 is NOT present in transcription!")
         else:
-            print(f"❌ HTTP Error: {response.status_code}")
-            print(f"   Response: {response.text[:500]}")
+            print(f"❌ Error: {result.get('error', 'Unknown error')}")
+    else:
+        print(f"❌ HTTP Error: {response.status}")
+        print(f"   Response: {content.decode('utf-8', errors='replace')[:500]}")
 
 if __name__ == "__main__":
-    test_file = "audio examples/detecting main speakers/speaker_0.wav"
-    test_enhance_api(test_file)
+    parser = argparse.ArgumentParser(description="Тест API enhance-main-speaker")
+    parser.add_argument("audio_path", nargs="?", default=DEFAULT_FILE, help="аудіофайл для відправки")
+    parser.add_argument("--url", default=DEFAULT_URL, help="адреса ендпоінта")
+    args = parser.parse_args()
+    test_enhance_api(args.audio_path, args.url)
 
@@ -5,6 +5,7 @@
 import os
 import sys
 import json
+import numpy as np
 
 # Додаємо поточну директорію до шляху
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -15,6 +16,8 @@ load_dotenv()
 
 # Імпортуємо функцію
 from app_ios_shortcuts import enhance_main_speaker_audio
+from speaker_stats import aggregate_by_speaker
+
 
 def test_enhance_main_speaker(audio_path):
     """Тестує enhance_main_speaker_audio на заданому файлі"""
@@ -56,13 +59,10 @@ def test_enhance_main_speaker(audio_path):
         print(f"\n📊 Speakers in transcription: {sorted(speakers_in_transcription)}")
         
         # Підраховуємо слова по спікерах
-        speaker_word_counts = {}
-        for seg in segments_info['transcription_segments']:
-            speaker = seg['speaker']
-            word_count = len(seg['text'].split())
-            if speaker not in speaker_word_counts:
-                speaker_word_counts[speaker] = 0
-            speaker_word_counts[speaker] += word_count
+        speaker_word_counts = aggregate_by_speaker(
+            [seg['speaker'] for seg in segments_info['transcription_segments']],
+            np.fromiter((len(seg['text'].split()) for seg in segments_info['transcription_segments']), dtype=np.int64),
+        )
         
         print(f"\n📊 Word distribution by speaker:")
         for speaker, count in sorted(speaker_word_counts.items()):
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Тест SpeechBrain сепарації: скомпільований і не скомпільований masknet
+мають давати однаковий результат, коли збалансований чанк коротший за максимальний
+(у скомпільованому режимі батчі доповнюються нулями до max_chunk_samples).
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import soundfile as sf
+
+import speechbrain_separation as sbs
+
+# 12 с при чанку до 10 с і перекритті 2 с -> два збалансовані чанки по 7 с
+DURATION_SECONDS = 12
+os.environ["SPEECHBRAIN_CHUNK_SECONDS"] = "10"
+os.environ["SPEECHBRAIN_OVERLAP_SECONDS"] = "2"
+os.environ["SPEECHBRAIN_OUTPUT_SUBTYPE"] = "FLOAT"
+os.environ["SPEECHBRAIN_LOADER_WORKERS"] = "0"
+os.environ.pop("SPEECHBRAIN_STREAM_OUTPUT", None)
+TOLERANCE = 1e-2
+
+
+def make_mixture(path):
+    """Суміш двох 'голосів' (гармоніки з різною основною частотою) з невеликим шумом"""
+    rng = np.random.default_rng(0)
+    t = np.arange(DURATION_SECONDS * sbs.TARGET_SAMPLE_RATE) / sbs.TARGET_SAMPLE_RATE
+    voice_a = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 6)) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+    voice_b = sum(np.sin(2 * np.pi * 230 * k * t) / k for k in range(1, 6)) * (np.sin(2 * np.pi * 0.3 * t) > 0)
+    mixture = 0.2 * (voice_a + voice_b) + 0.01 * rng.standard_normal(len(t))
+    sf.write(path, mixture.astype(np.float32), sbs.TARGET_SAMPLE_RATE)
+
+
+def run_separation(audio_path, output_dir, compile_flag):
+    """Запускає separate() з чистим кешем моделі; повертає (compiled, треки)"""
+    os.environ["SPEECHBRAIN_COMPILE"] = compile_flag
+    sbs._MODEL_CACHE.clear()
+    sbs._WARMED_SHAPES.clear()
+    result = sbs.separate(audio_path, output_dir)
+    assert result["success"], result
+    compiled = next(iter(sbs._MODEL_CACHE.values()))[1]
+    tracks = [sf.read(speaker["local_path"], dtype="float32")[0] for speaker in result["speakers"]]
+    return compiled, np.stack(tracks)
+
+
+print("=" * 60)
+print("🧪 TEST: SpeechBrain separation - compiled vs eager")
+print("=" * 60)
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    audio_path = os.path.join(tmp_dir, "mixture.wav")
+    make_mixture(audio_path)
+
+    sbs.import_heavy_modules()
+    dataset = sbs.ChunkDataset(audio_path, 10 * sbs.TARGET_SAMPLE_RATE, 2 * sbs.TARGET_SAMPLE_RATE)
+    print(f"📊 Chunks: {len(dataset)}, chunk_samples={dataset.chunk_samples}, max_chunk_samples={10 * sbs.TARGET_SAMPLE_RATE}")
+    assert dataset.chunk_samples < 10 * sbs.TARGET_SAMPLE_RATE, "balanced chunk must be shorter than the maximum"
+
+    _, eager = run_separation(audio_path, os.path.join(tmp_dir, "eager"), "0")
+    compiled, compiled_tracks = run_separation(audio_path, os.path.join(tmp_dir, "compiled"), "1")
+    if not compiled:
+        print("⚠️  SKIPPED: torch.compile is not available on this host")
+        sys.exit(0)
+
+    assert eager.shape == compiled_tracks.shape, (eager.shape, compiled_tracks.shape)
+    max_diff = np.abs(eager - compiled_tracks).max()
+    print(f"📊 Output shape: {eager.shape}, max abs diff compiled vs eager: {max_diff:.2e}")
+    assert max_diff < TOLERANCE, f"compiled output differs from eager by {max_diff:.2e}"
+    print("✅ Compiled and eager outputs match")